@@ -3,17 +3,28 @@
 """
 from __future__ import annotations
 
+import functools
+import re
 from contextlib import contextmanager
 from typing import Any
+from typing import Callable
+from typing import cast
 from typing import Generator
+from typing import Iterable
 from typing import TYPE_CHECKING
+from typing import TypeVar
 
 from lektor.context import Context
 from lektor.context import get_ctx
 
+from lektorlib.recordcache import get_pad_cache
+
 if TYPE_CHECKING:
+    from lektor.db import Pad
     from lektor.sourceobj import VirtualSourceObject
 
+_F = TypeVar("_F", bound=Callable[..., Any])
+
 
 @contextmanager
 def disable_dependency_recording() -> Generator[None, None, None]:
@@ -32,10 +43,97 @@ def disable_dependency_recording() -> Generator[None, None, None]:
             yield
 
 
+@contextmanager
+def filter_dependency_recording(
+    keep: str | re.Pattern[str] | Callable[[str | VirtualSourceObject], bool],
+) -> Generator[None, None, None]:
+    """Record only selected dependencies within context
+
+    If ``keep`` is callable, it is passed each dependency — either a
+    filename, or a virtual source — and should return true if that
+    dependency is to be recorded.  Otherwise, ``keep`` should be a
+    regular expression: only dependencies whose filename (or, for
+    virtual sources, path) match it are recorded.  (Use
+    ``fnmatch.translate`` to convert a glob pattern to a regular
+    expression.)
+
+    """
+    ctx = get_ctx()
+    if ctx is None:
+        yield
+    else:
+        with DependencyFilteringContextProxy(ctx, keep):
+            yield
+
+
+@contextmanager
+def batch_dependency_recording() -> Generator[None, None, None]:
+    """Collect dependencies within context, recording each distinct
+    dependency only once, when the context exits
+
+    This saves bookkeeping when the same dependencies are recorded over
+    and over (e.g. when rendering long lists of records.)
+
+    """
+    ctx = get_ctx()
+    if ctx is None:
+        yield
+    else:
+        proxy = DependencyCollectingContextProxy(ctx)
+        try:
+            with proxy:
+                yield
+        finally:
+            proxy.flush()
+
+
+@contextmanager
+def collect_dependencies(
+    pad: Pad,
+) -> Generator[list[str | VirtualSourceObject], None, None]:
+    """Collect the dependencies recorded within context, rather than
+    recording them
+
+    Yields a list which, when the context exits, holds each distinct
+    dependency recorded within the context.  All dependencies are
+    collected, even if dependency recording is currently disabled, so
+    that they can be memoized and replayed (with
+    ``record_dependencies``) later.
+
+    The attributes of the current context (``source``, ``build_state``,
+    etc.) remain visible within the context.  If there is no current
+    context, a fresh one, for ``pad``, is used.
+
+    """
+    dependencies: list[str | VirtualSourceObject] = []
+    ctx = get_ctx()
+    if ctx is None:
+        collecting_ctx = Context(pad=pad)
+    else:
+        # The proxy is never flushed
+        collecting_ctx = DependencyCollectingContextProxy(ctx)
+    with collecting_ctx, collecting_ctx.gather_dependencies(dependencies.append):
+        yield dependencies
+    dependencies[:] = unique_dependencies(dependencies)
+
+
 class DependencyIgnoringContextProxy(Context):  # type: ignore[misc]
+    """A context which ignores dependencies, but otherwise behaves
+    like the context it wraps.
+
+    The instance attributes of the wrapped context are copied to the
+    proxy when it is created, so that accessing them (e.g. ``ctx.pad``,
+    ``ctx.source``) does not incur the overhead of a call to
+    ``__getattr__``.  Mutable attributes, like ``cache``, are shared with
+    the wrapped context.  Any other attributes are forwarded to the
+    wrapped context by ``__getattr__``.
+
+    """
+
     __slots__ = ["_ctx"]
 
     def __init__(self, ctx: Context):
+        self.__dict__.update(vars(ctx))
         self._ctx = ctx
 
     def __getattr__(self, attr: str) -> Any:
@@ -46,3 +144,168 @@ class DependencyIgnoringContextProxy(Context):  # type: ignore[misc]
 
     def record_virtual_dependency(self, virtual_source: VirtualSourceObject) -> None:
         pass
+
+
+class DependencyFilteringContextProxy(DependencyIgnoringContextProxy):
+    """A context which passes only selected dependencies to the context
+    it wraps.
+
+    """
+
+    __slots__ = ["_keep"]
+
+    def __init__(
+        self,
+        ctx: Context,
+        keep: str | re.Pattern[str] | Callable[[str | VirtualSourceObject], bool],
+    ):
+        super().__init__(ctx)
+        if not callable(keep):
+            keep = _regex_matcher(keep)
+        self._keep = keep
+
+    def record_dependency(self, filename: str, affects_url: bool | None = None) -> None:
+        if self._keep(filename):
+            if affects_url is None:
+                self._ctx.record_dependency(filename)
+            else:
+                self._ctx.record_dependency(filename, affects_url=affects_url)
+
+    def record_virtual_dependency(self, virtual_source: VirtualSourceObject) -> None:
+        if self._keep(virtual_source):
+            self._ctx.record_virtual_dependency(virtual_source)
+
+
+def _regex_matcher(
+    pattern: str | re.Pattern[str],
+) -> Callable[[str | VirtualSourceObject], bool]:
+    search = re.compile(pattern).search
+
+    def match(dep: str | VirtualSourceObject) -> bool:
+        return search(dep if isinstance(dep, str) else dep.path) is not None
+
+    return match
+
+
+class DependencyCollectingContextProxy(DependencyIgnoringContextProxy):
+    """A context which collects dependencies, passing each distinct one
+    to the context it wraps only when ``flush`` is called.
+
+    Dependency collectors registered (via ``gather_dependencies``) with
+    the proxy itself are called for every dependency, immediately.
+
+    """
+
+    __slots__ = ["_dependencies", "_virtual_dependencies", "_dependency_collectors"]
+
+    def __init__(self, ctx: Context):
+        super().__init__(ctx)
+        # Do not share the wrapped context's collectors
+        self._dependency_collectors: list[Callable[[Any], None]] = []
+        self._dependencies: dict[tuple[str, bool | None], None] = {}
+        self._virtual_dependencies: dict[str, VirtualSourceObject] = {}
+
+    def record_dependency(self, filename: str, affects_url: bool | None = None) -> None:
+        self._dependencies[filename, affects_url] = None
+        for collector in self._dependency_collectors:
+            collector(filename)
+
+    def record_virtual_dependency(self, virtual_source: VirtualSourceObject) -> None:
+        self._virtual_dependencies.setdefault(virtual_source.path, virtual_source)
+        for collector in self._dependency_collectors:
+            collector(virtual_source)
+
+    def flush(self) -> None:
+        """Pass the collected dependencies to the wrapped context."""
+        ctx = self._ctx
+        dependencies, self._dependencies = self._dependencies, {}
+        virtual_dependencies, self._virtual_dependencies = (
+            self._virtual_dependencies,
+            {},
+        )
+        for filename, affects_url in dependencies:
+            if affects_url is None:
+                ctx.record_dependency(filename)
+            else:
+                ctx.record_dependency(filename, affects_url=affects_url)
+        for virtual_source in virtual_dependencies.values():
+            ctx.record_virtual_dependency(virtual_source)
+
+
+def memoize_with_dependencies(func: _F) -> _F:
+    """Memoize a function, along with the dependencies it records.
+
+    The first time the decorated function is called (with a given set
+    of arguments) the dependencies it records are gathered, and stored
+    along with its return value.  Subsequent calls return the stored
+    value, replaying the stored dependencies into the current context.
+
+    Values are cached per pad (that of the current context), so the
+    cache is discarded along with the pad.  The arguments must be
+    hashable.  If there is no current context, no caching is done.
+
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        ctx = get_ctx()
+        if ctx is None:
+            return func(*args, **kwargs)
+
+        cache = get_pad_cache(ctx.pad, memoize_with_dependencies)
+        key = (func, args, frozenset(kwargs.items()))
+        try:
+            value, dependencies = cache[key]
+        except KeyError:
+            pass
+        else:
+            record_dependencies(dependencies)
+            return value
+
+        dependencies = []
+        with ctx.gather_dependencies(dependencies.append):
+            value = func(*args, **kwargs)
+
+        if _records_all_dependencies(ctx):
+            cache[key] = value, unique_dependencies(dependencies)
+        return value
+
+    return cast(_F, wrapper)
+
+
+def record_dependencies(dependencies: Iterable[str | VirtualSourceObject]) -> None:
+    """Record dependencies (filenames or virtual sources) in the current
+    context, if there is one.
+
+    This can be used to replay dependencies previously gathered using
+    ``Context.gather_dependencies``.
+
+    """
+    ctx = get_ctx()
+    if ctx is not None:
+        for dep in dependencies:
+            if isinstance(dep, str):
+                ctx.record_dependency(dep)
+            else:
+                ctx.record_virtual_dependency(dep)
+
+
+def unique_dependencies(
+    dependencies: Iterable[str | VirtualSourceObject],
+) -> list[str | VirtualSourceObject]:
+    """Remove duplicates from a sequence of dependencies, preserving order.
+
+    Virtual sources are considered duplicates if they have the same path.
+
+    """
+    unique: dict[str, str | VirtualSourceObject] = {}
+    for dep in dependencies:
+        unique.setdefault(dep if isinstance(dep, str) else dep.path, dep)
+    return list(unique.values())
+
+
+def _records_all_dependencies(ctx: Context) -> bool:
+    """Whether all dependencies recorded to ctx are seen by its collectors."""
+    return not isinstance(ctx, DependencyIgnoringContextProxy) or isinstance(
+        ctx, DependencyCollectingContextProxy
+    )
@@ -0,0 +1,113 @@
+"""An on-disk cache of virtual sources which persists across builds.
+
+The Lektor record cache lives only as long as its pad.  This provides a
+second-level cache, stored in an SQLite database, which allows
+expensive-to-compute virtual sources to be reused by later builds, so
+long as the source files they depend on have not changed.
+
+The states returned by the caller's ``dump`` function (see
+``lektorlib.sourcecache``) must be picklable.
+
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+from typing import Any
+from typing import Sequence
+from typing import TYPE_CHECKING
+
+from lektor.utils import get_cache_dir
+
+from lektorlib.sourcecache import _Key
+from lektorlib.sourcecache import SourceCache
+
+if TYPE_CHECKING:
+    from lektor.environment import Environment
+
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS virtual_sources (
+        path TEXT NOT NULL,
+        alt TEXT NOT NULL,
+        virtual_path TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        state BLOB,
+        PRIMARY KEY (path, alt, virtual_path)
+    )
+"""
+
+
+class DiskCache(SourceCache):
+    """A persistent, on-disk cache of virtual sources."""
+
+    def __init__(self, filename: str | os.PathLike[str]):
+        super().__init__()
+        self.filename = os.fspath(filename)
+        self._db: sqlite3.Connection | None = None
+
+    @classmethod
+    def for_env(cls, env: Environment) -> DiskCache:
+        """Get a disk cache stored in the Lektor cache directory for a
+        project.
+
+        """
+        # NB: the project id is a hash of the path to the project
+        filename = os.path.join(
+            get_cache_dir(), "lektorlib", env.project.id, "virtual-sources.sqlite3"
+        )
+        return cls(filename)
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+            db = sqlite3.connect(
+                self.filename, isolation_level=None, check_same_thread=False
+            )
+            # This is only a cache, so we do not need durability.
+            db.execute("PRAGMA synchronous = OFF")
+            db.execute(_SCHEMA)
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def clear(self) -> None:
+        """Discard all cache entries."""
+        with self._lock:
+            self.db.execute("DELETE FROM virtual_sources")
+
+    def _load_entry(self, key: _Key, fingerprint: str) -> Any:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT state FROM virtual_sources"
+                " WHERE path = ? AND alt = ? AND virtual_path = ?"
+                " AND fingerprint = ?",
+                (*key, fingerprint),
+            ).fetchone()
+        if row is None:
+            return Ellipsis
+        if row[0] is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return Ellipsis  # corrupt entry; recompute it
+
+    def _store_entry(
+        self, key: _Key, fingerprint: str, filenames: Sequence[str], state: Any
+    ) -> None:
+        blob = None if state is None else pickle.dumps(state)
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO virtual_sources"
+                " (path, alt, virtual_path, fingerprint, state)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (*key, fingerprint, blob),
+            )
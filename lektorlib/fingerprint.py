@@ -0,0 +1,54 @@
+"""Cheap fingerprints of the state of source files.
+
+These can be used to decide whether something computed from a set of
+source files is still up to date, without having to read or parse the
+files.
+
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Iterable
+from typing import Iterator
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from lektor.db import Record
+    from lektor.sourceobj import VirtualSourceObject
+
+
+def fingerprint_files(filenames: Iterable[str]) -> str:
+    """Compute a fingerprint of the current state of some files.
+
+    The fingerprint is computed from the names, sizes and modification
+    times of the files — their contents are not read.  Files which do not
+    exist are accounted for, too, so that creating them changes the
+    fingerprint.
+
+    """
+    h = hashlib.sha1()
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            state = "-"
+        else:
+            state = f"{st.st_mtime_ns}:{st.st_size}"
+        h.update(f"{filename}\0{state}\0".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
+def iter_source_filenames(
+    source: Record | VirtualSourceObject,
+) -> Iterator[str]:
+    """Iterate over the names of the files the data of a source is loaded from.
+
+    This includes the source's own source files, as well as the file
+    defining its datamodel, if it has one.
+
+    """
+    yield from source.iter_source_filenames()
+    datamodel = getattr(source, "datamodel", None)
+    if datamodel is not None and datamodel.filename:
+        yield datamodel.filename
@@ -0,0 +1,132 @@
+"""An inverted index which maps field values to the children of a
+record.  This can be used to efficiently construct queries for the
+same records as ``record.children.filter(F.tag == value)``.
+
+"""
+from __future__ import annotations
+
+from typing import Hashable
+from typing import Iterable
+from typing import Iterator
+from typing import TYPE_CHECKING
+
+from jinja2 import Undefined
+from lektor.context import get_ctx
+
+from lektorlib.context import collect_dependencies
+from lektorlib.context import record_dependencies
+from lektorlib.query import PrecomputedQuery
+from lektorlib.recordcache import get_pad_cache
+
+if TYPE_CHECKING:
+    from lektor.db import Query
+    from lektor.db import Record
+
+
+class FieldIndex:
+    """An inverted index mapping the values of a field to the (ordered) ids
+    of the records, from a query, which have that value.
+
+    If the field value is a list (e.g. for a ``strings`` field), each of
+    the items in the list is indexed.
+
+    The query is iterated over only once, when the index is constructed.
+    The dependencies recorded while doing so (on all of the records
+    iterated over, and on the parent record and its directory) are
+    collected, rather than recorded.  Since any of those records could
+    change the index, they are replayed whenever the index is used, e.g.
+    by ``query`` and ``query_in``.
+
+    """
+
+    def __init__(self, query: Query, field: str):
+        self.path = query.path
+        self.alt = query.alt
+        self.pad = query.pad
+        self.field = field
+
+        ids: dict[Hashable, list[str]] = {}
+        positions: dict[str, int] = {}
+        with collect_dependencies(self.pad) as dependencies:
+            if "@" not in self.path:
+                # A new child changes the directory (as Query._iterate
+                # notes.)
+                get_ctx().record_dependency(self.pad.db.to_fs_path(self.path))
+            for record in query:
+                try:
+                    value = record[field]
+                except KeyError:
+                    continue
+                if isinstance(value, (list, tuple)):
+                    values = value
+                elif isinstance(value, Undefined):
+                    continue
+                else:
+                    values = (value,)
+
+                id = record["_id"]
+                positions[id] = len(positions)
+                for value in values:
+                    ids.setdefault(value, []).append(id)
+        self.__ids = ids
+        self.__positions = positions
+        self.__dependencies = dependencies
+
+    def __contains__(self, value: Hashable) -> bool:
+        record_dependencies(self.__dependencies)
+        return value in self.__ids
+
+    def __iter__(self) -> Iterator[Hashable]:
+        """Iterate over the distinct field values in the index."""
+        record_dependencies(self.__dependencies)
+        return iter(self.__ids)
+
+    def __len__(self) -> int:
+        record_dependencies(self.__dependencies)
+        return len(self.__ids)
+
+    def ids(self, value: Hashable) -> list[str]:
+        """The ids of the records which have the given field value."""
+        record_dependencies(self.__dependencies)
+        return list(self.__ids.get(value, ()))
+
+    def query(self, value: Hashable) -> PrecomputedQuery[Record]:
+        """A query for the records with the given field value.
+
+        This yields the same records as filtering the original query by
+        ``F[field] == value`` (or ``F[field].contains(value)`` for list
+        fields.)
+
+        """
+        record_dependencies(self.__dependencies)
+        return self.__make_query(self.__ids.get(value, ()))
+
+    def query_in(self, values: Iterable[Hashable]) -> PrecomputedQuery[Record]:
+        """A query for the records whose field value is any of ``values``.
+
+        The records are returned in the order of the original query.
+
+        """
+        record_dependencies(self.__dependencies)
+        ids: set[str] = set()
+        for value in values:
+            ids.update(self.__ids.get(value, ()))
+        return self.__make_query(sorted(ids, key=self.__positions.__getitem__))
+
+    def __make_query(self, ids: Iterable[str]) -> PrecomputedQuery[Record]:
+        return PrecomputedQuery(self.path, self.pad, ids, alt=self.alt)
+
+
+def get_field_index(record: Record, field: str) -> FieldIndex:
+    """Get a ``FieldIndex`` of the values of ``field`` for the children of
+    ``record``.
+
+    The index is built only once per pad.
+
+    """
+    cache = get_pad_cache(record.pad, FieldIndex)
+    key = (record.path, record.alt, field)
+    index = cache.get(key)
+    if index is None:
+        index = cache[key] = FieldIndex(record.children, field)
+    return index
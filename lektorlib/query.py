@@ -5,11 +5,20 @@ sequence of sources.  This works for virtual sources, too.
 """
 from __future__ import annotations
 
+import hashlib
+import heapq
+import os
 import sys
+import time
 from collections import OrderedDict
+from itertools import islice
+from typing import Any
+from typing import Callable
 from typing import Generator
 from typing import Generic
+from typing import Hashable
 from typing import Iterable
+from typing import Iterator
 from typing import Sequence
 from typing import TYPE_CHECKING
 from typing import TypeVar
@@ -19,6 +28,19 @@ from lektor.db import Query
 from lektor.db import Record
 from lektor.environment import PRIMARY_ALT
 from lektor.sourceobj import VirtualSourceObject
+from lektor.utils import cleanup_path
+
+from lektorlib.context import collect_dependencies
+from lektorlib.context import disable_dependency_recording
+from lektorlib.context import record_dependencies
+from lektorlib.fingerprint import fingerprint_files
+from lektorlib.fingerprint import iter_source_filenames
+from lektorlib.recordcache import get_or_create_virtual
+from lektorlib.recordcache import get_pad_cache
+from lektorlib.tracing import emit
+from lektorlib.tracing import is_tracing
+from lektorlib.tracing import Span
+from lektorlib.tracing import trace
 
 if sys.version_info >= (3, 10):
     from types import EllipsisType
@@ -37,6 +59,21 @@ def get_source(
     concrete records.
 
     """
+    if not is_tracing():
+        return _get_source(pad, path, alt, page_num, persist)
+    with trace("get_source", path.rpartition("/")[0] or "/") as span:
+        source = _get_source(pad, path, alt, page_num, persist)
+        span.loaded = span.yielded = int(source is not None)
+    return source
+
+
+def _get_source(
+    pad: Pad,
+    path: str,
+    alt: str,
+    page_num: int | None,
+    persist: bool,
+) -> Record | VirtualSourceObject | None:
     # lektor.db.Pad.get does not support page_num on a virtual path.
     # This is mostly because there seems to be no official syntax for
     # contructing a virtual path with a page number.
@@ -55,22 +92,82 @@ def get_source(
     if page_num is None or "@" not in path:
         return pad.get(path, alt=alt, page_num=page_num, persist=persist)
 
-    source = pad.get(path, persist=persist, alt=alt)
-    if source is None:
-        return None
-    try:
-        pagination = source.pagination
-    except (AttributeError, RuntimeError):
-        # The lektor.db.Page.pagination property raises RuntimeError
-        # rather than AttributeError if pagination is not enabled for
-        # the page.
+    record_path, virtual_path = path.split("@", 1)
+    record = pad.get(record_path, alt=alt, persist=persist)
+    if record is None:
         return None
 
-    paginated_source = pagination.for_page(page_num)
-    pad.db.track_record_dependency(paginated_source)
+    def paginate() -> VirtualSourceObject | None:
+        source = pad.get(path, persist=persist, alt=alt)
+        if source is None:
+            return None
+        try:
+            pagination = source.pagination
+        except (AttributeError, RuntimeError):
+            # The lektor.db.Page.pagination property raises RuntimeError
+            # rather than AttributeError if pagination is not enabled for
+            # the page.
+            return None
+        return pagination.for_page(page_num)
+
+    # Cache the paginated source in the record cache.  The ``@`` in the
+    # virtual path used for the cache key ensures that it will not
+    # collide with the key of any other source.
+    paginated_source = get_or_create_virtual(
+        record, f"{virtual_path}@{page_num:d}", paginate, persist=persist
+    )
+    if paginated_source is not None:
+        pad.db.track_record_dependency(paginated_source)
     return paginated_source
 
 
+def get_sources(
+    pad: Pad,
+    paths: Iterable[str],
+    alt: str = PRIMARY_ALT,
+    page_num: int | None = None,
+    persist: bool = True,
+) -> list[Record | VirtualSourceObject | None]:
+    """Like get_source() but loads a batch of sources at once.
+
+    When loading (unpaginated) virtual sources, the record each virtual
+    path is relative to is resolved only once per batch, and sources
+    which are already in the pad's record cache are taken straight from
+    there, without going through the path resolution done by
+    ``Pad.get``.
+
+    """
+    return list(_iter_sources(pad, paths, alt, page_num, persist))
+
+
+def _iter_sources(
+    pad: Pad,
+    paths: Iterable[str],
+    alt: str,
+    page_num: int | None,
+    persist: bool,
+) -> Iterator[Record | VirtualSourceObject | None]:
+    """Like get_sources(), but lazily loads each source as it is needed."""
+    cache = pad.cache
+    parents: dict[str, Record | None] = {}
+    for path in paths:
+        base_path, sep, virtual_path = path.partition("@")
+        if sep and page_num is None and "@" not in virtual_path:
+            # unpaginated virtual source
+            if base_path not in parents:
+                parents[base_path] = pad.get(base_path, alt=alt, persist=persist)
+            record = parents[base_path]
+            if record is None:
+                yield None
+                continue
+            source = cache.get(record.path, alt, virtual_path)
+            if source is Ellipsis:
+                source = pad.get_virtual(record, virtual_path)
+            yield source
+        else:
+            yield get_source(pad, path, alt=alt, page_num=page_num, persist=persist)
+
+
 _DBSourceObject = TypeVar("_DBSourceObject", bound="Record | VirtualSourceObject")
 
 
@@ -92,6 +189,8 @@ class PrecomputedQuery(Generic[_DBSourceObject], Query):  # type: ignore[misc]
 
     # Annotations for fields inherited from Query
     _order_by: Sequence[str] | None
+    _offset: int | None
+    _limit: int | None
     _page_num: int | None
 
     def __init__(
@@ -105,6 +204,7 @@ class PrecomputedQuery(Generic[_DBSourceObject], Query):  # type: ignore[misc]
         # We really just want an ordered set, but we'll use an OrderedDict
         # to avoid requiring another library.
         self.__child_ids = OrderedDict((id_, None) for id_ in child_ids)
+        self.__pristine_filtering = self.__filtering()
         self.__assert_is_not_attachment_query()
 
     def _get(
@@ -124,35 +224,294 @@ class PrecomputedQuery(Generic[_DBSourceObject], Query):  # type: ignore[misc]
             persist=persist,
         )
 
-    def _iterate(self) -> Generator[_DBSourceObject, None, None]:
+    def _get_batch(
+        self, ids: Sequence[str], persist: bool = True
+    ) -> list[_DBSourceObject | None]:
+        """Low level batch record access."""
+        return list(self._iter_batch(ids, persist=persist))
+
+    def _iter_batch(
+        self, ids: Sequence[str], persist: bool = True
+    ) -> Iterator[_DBSourceObject | None]:
+        """Low level batch record access, loading each record lazily."""
+        return _iter_sources(
+            self.pad,
+            [f"{self.path}/{id}" for id in ids],
+            self.alt,
+            self._page_num,
+            persist,
+        )
+
+    def _iterate(
+        self, child_ids: Iterable[str] | None = None
+    ) -> Iterator[_DBSourceObject]:
+        """Low level record iteration.
+
+        By default, this iterates over all of our ``child_ids``.  If
+        ``child_ids`` is passed, only those children are loaded.
+
+        """
+        if is_tracing():
+            return self.__traced_iterate(child_ids)
+        return self.__iterate(child_ids)
+
+    def __traced_iterate(
+        self, child_ids: Iterable[str] | None
+    ) -> Generator[_DBSourceObject, None, None]:
+        # Only the time spent within the underlying iterator is counted.
+        span = Span("iterate", self.path)
+        records = self.__iterate(child_ids, span)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    record = next(records)
+                except StopIteration:
+                    return
+                finally:
+                    span.duration += time.perf_counter() - start
+                span.yielded += 1
+                yield record
+        finally:
+            records.close()
+            emit(span)
+
+    def __iterate(
+        self, child_ids: Iterable[str] | None, span: Span | None = None
+    ) -> Generator[_DBSourceObject, None, None]:
         self.__assert_is_not_attachment_query()
         # note dependencies
         self_record = self.pad.get(self.path, alt=self.alt)
         if self_record is not None:
             self.pad.db.track_record_dependency(self_record)
 
-        for id in self.__child_ids:
-            record = self._get(id, persist=False)
+        # Children are loaded lazily, one at a time, so that callers
+        # which do not consume the whole iterator (e.g. first()) load,
+        # and record dependencies on, only the children they have seen.
+        # (The parent record of virtual children is resolved only once.)
+        child_ids = list(self.__child_ids if child_ids is None else child_ids)
+        if self._page_num is not None:
+            child_ids = self.__skip_unpaginated(child_ids)
+        records = self._iter_batch(child_ids, persist=False)
+        for id, record in zip(child_ids, records):
             if record is None:
-                if self._page_num is not None:
-                    # Sanity check: ensure the unpaginated version exists
-                    unpaginated = self._get(id, persist=False, page_num=None)
-                    if unpaginated is not None:
-                        # Requested explicit page_num, but source does not
-                        # support pagination.  Punt and skip it.
-                        continue
+                if self._page_num is not None and self.__is_unpaginated(id):
+                    # Requested explicit page_num, but source does not
+                    # support pagination.  Punt and skip it.
+                    continue
                 path = f"{self.path}/{id}"
                 raise RuntimeError("could not load source for %r" % path)
 
+            if span is not None:
+                span.loaded += 1
             is_page = not getattr(record, "is_attachment", False)
-            if is_page and self._matches(record):
+            if is_page and self.__matches(record, span):
                 yield record
 
+    def __matches(self, record: _DBSourceObject, span: Span | None) -> bool:
+        if span is None:
+            return bool(self._matches(record))
+        start = time.perf_counter()
+        try:
+            return bool(self._matches(record))
+        finally:
+            span.filter_time += time.perf_counter() - start
+
+    def __unpaginated_cache(self) -> dict[Any, Any]:
+        """The per-pad cache of children known to not support pagination.
+
+        This maps ``(path, alt, page_num)`` of each child that has been
+        checked to the dependencies recorded while loading its
+        unpaginated version, or to ``None`` if the child does not exist at
+        all.  The page number is part of the key, since a child which
+        does support pagination may have no page with that number.
+
+        """
+        return get_pad_cache(self.pad, (PrecomputedQuery, "unpaginated"))
+
+    def __skip_unpaginated(self, child_ids: list[str]) -> list[str]:
+        """Omit the children known to not support pagination.
+
+        The dependencies which would have been recorded when loading
+        the omitted children are recorded instead.
+
+        """
+        cache = self.__unpaginated_cache()
+        if not cache:
+            return child_ids
+        loadable = []
+        for id in child_ids:
+            dependencies = cache.get((f"{self.path}/{id}", self.alt, self._page_num))
+            if dependencies is None:
+                loadable.append(id)
+            else:
+                record_dependencies(dependencies)
+        return loadable
+
+    def __is_unpaginated(self, id: str) -> bool:
+        """Check whether a child, whose paginated version could not be
+        loaded, exists but does not support pagination.
+
+        The answer is remembered per pad.
+
+        """
+        cache = self.__unpaginated_cache()
+        key = (f"{self.path}/{id}", self.alt, self._page_num)
+        if key in cache:
+            return cache[key] is not None
+        with collect_dependencies(self.pad) as dependencies:
+            unpaginated = self._get(id, persist=False, page_num=None)
+        if unpaginated is None:
+            cache[key] = None
+            return False
+        record_dependencies(dependencies)
+        cache[key] = dependencies
+        return True
+
+    def __iter__(self) -> Iterator[_DBSourceObject]:
+        order_by = self.get_order_by()
+        start, stop = self.__slice_bounds()
+        if not order_by:
+            if self.__is_sliceable():
+                # optimization: the results are just a slice of child_ids,
+                # so only load the records within that slice.
+                yield from self._iterate(islice(self.__child_ids, start, stop))
+            else:
+                yield from islice(self._iterate(), start, stop)
+            return
+
+        order_by = tuple(order_by)
+        ids = self.__get_memoized_order(order_by)
+        if ids is not None:
+            yield from self._iterate(ids[start:stop])
+            return
+
+        sort_key = self.__sort_key_func(order_by)
+        if stop is not None:
+            # optimization: when only a limited slice of the sorted
+            # results is wanted, select it using a bounded heap rather
+            # than sorting all of the records.  Records which can not
+            # make it into the slice are dropped as soon as they are
+            # seen.
+            records = heapq.nsmallest(stop, self._iterate(), key=sort_key)
+        elif self.__is_unfiltered():
+            records = self.__sort_and_memoize(order_by, sort_key)
+        else:
+            records = sorted(self._iterate(), key=sort_key)
+        yield from records[start:stop]
+
+    def __sort_key_func(
+        self, order_by: tuple[str, ...]
+    ) -> Callable[[_DBSourceObject], Any]:
+        """Get a sort key function which memoizes the computed keys.
+
+        The keys are cached per pad, parent path, alt and ``order_by``.
+        Since the pad's view of the data does not change, they remain
+        valid even after the records they were computed from have been
+        dropped from the pad's record cache.
+
+        """
+        pad_cache = get_pad_cache(self.pad, (PrecomputedQuery, "sort_keys"))
+        keys = pad_cache.setdefault((self.path, self.alt, order_by), {})
+
+        def sort_key(record: _DBSourceObject) -> Any:
+            path = record.path
+            try:
+                return keys[path]
+            except KeyError:
+                key = keys[path] = record.get_sort_key(order_by)
+                return key
+
+        return sort_key
+
+    def __order_cache_key(self, order_by: tuple[str, ...]) -> Hashable:
+        return (self.path, self.alt, tuple(self.__child_ids), order_by)
+
+    def __sort_and_memoize(
+        self, order_by: tuple[str, ...], sort_key: Callable[[_DBSourceObject], Any]
+    ) -> list[_DBSourceObject]:
+        """Sort all of our records, memoizing the sorted ids.
+
+        The dependencies recorded while loading the records are memoized,
+        too.
+
+        """
+        with collect_dependencies(self.pad) as dependencies:
+            records = sorted(self._iterate(), key=sort_key)
+        record_dependencies(dependencies)
+
+        ids_by_path = {cleanup_path(f"{self.path}/{id}"): id for id in self.__child_ids}
+        ids = [ids_by_path.get(cleanup_path(record.path)) for record in records]
+        if None not in ids:
+            cache = get_pad_cache(self.pad, (PrecomputedQuery, "orders"))
+            cache[self.__order_cache_key(order_by)] = ids, dependencies
+        return records
+
+    def __get_memoized_order(self, order_by: tuple[str, ...]) -> list[str] | None:
+        """Get the memoized sorted list of the ids of our (matching)
+        children, if there is one.
+
+        Sorted orders are memoized per pad, only for unfiltered queries.
+        Since the order depends on all of the children, the dependencies
+        recorded when it was computed are recorded again.
+
+        """
+        if not self.__is_unfiltered():
+            return None
+        cache = get_pad_cache(self.pad, (PrecomputedQuery, "orders"))
+        memoized = cache.get(self.__order_cache_key(order_by))
+        if memoized is None:
+            return None
+        ids, dependencies = memoized
+        record_dependencies(dependencies)
+        return ids  # type: ignore[no-any-return]
+
     def get_order_by(self) -> Sequence[str] | None:
         # child_ids are already in default order, so unless an ordering
         # is explicitly applied, we do not need to sort the results
         return self._order_by
 
+    def __filtering(self) -> tuple[object, ...]:
+        """The query settings which affect which children are matched."""
+        return (
+            self._filters,
+            self._include_hidden,
+            self._include_undiscoverable,
+            self._page_num,
+        )
+
+    def __is_unfiltered(self) -> bool:
+        """Determine whether the query applies no filters of its own.
+
+        This is the case if the query is pristine, except perhaps for an
+        applied ordering, offset or limit.
+
+        """
+        return self.__filtering() == self.__pristine_filtering
+
+    def __is_sliceable(self) -> bool:
+        """Determine whether the query results are just (a slice of) child_ids.
+
+        This is the case if matching can not drop any children: the
+        query applies no filters, and includes both hidden and
+        undiscoverable children.  The child ids of an unfiltered query
+        are trusted to all match, too, as they are by ``count()``.
+
+        """
+        if self.__is_unfiltered():
+            return True
+        return (
+            not self._filters
+            and self._include_hidden is not False
+            and bool(self._include_undiscoverable)
+            and self._page_num is None
+        )
+
+    def __slice_bounds(self) -> tuple[int, int | None]:
+        start = self._offset or 0
+        stop = start + self._limit if self._limit else None
+        return start, stop
+
     def __assert_is_not_attachment_query(self) -> None:
         if not self._include_pages or self._include_attachments:
             raise AssertionError("Attachment queries are not currently supported")
@@ -161,6 +520,10 @@ class PrecomputedQuery(Generic[_DBSourceObject], Query):  # type: ignore[misc]
         if self._pristine:
             # optimization
             return len(self.__child_ids)
+        if self.__is_sliceable():
+            # optimization
+            start, stop = self.__slice_bounds()
+            return len(range(len(self.__child_ids))[start:stop])
         return super().count()  # type: ignore[no-any-return]
 
     def get(
@@ -171,6 +534,166 @@ class PrecomputedQuery(Generic[_DBSourceObject], Query):  # type: ignore[misc]
             return self._get(id, page_num=page_num)
         return None
 
+    def values(self, *fields: str) -> list[tuple[Any, ...]]:
+        """Get the values of ``fields`` for each of the query's results.
+
+        Returns a list of tuples, one per result, in order.
+
+        For queries without filters, the values are cached per pad, along
+        with the dependencies recorded while computing them, so repeated
+        calls are cheap.
+
+        """
+        if not fields:
+            raise TypeError("values() requires at least one field name")
+
+        cache: dict[Any, Any] | None = None
+        if self.__is_unfiltered():
+            cache = get_pad_cache(self.pad, (PrecomputedQuery, "values"))
+            key = (
+                self.path,
+                self.alt,
+                tuple(self.__child_ids),
+                tuple(self.get_order_by() or ()),
+                self.__slice_bounds(),
+                fields,
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                record_dependencies(cached[1])
+                return list(cached[0])
+
+        with collect_dependencies(self.pad) as dependencies:
+            values = [tuple(record[field] for field in fields) for record in self]
+        record_dependencies(dependencies)
+        if cache is not None:
+            cache[key] = values, dependencies
+        return list(values)
+
+    def pluck(self, field: str) -> list[Any]:
+        """Get the value of ``field`` for each of the query's results."""
+        return [value for value, in self.values(field)]
+
+    def fingerprint(self) -> str:
+        """Compute a cheap fingerprint of the inputs to this query.
+
+        The fingerprint is computed from the query's path, alt and
+        (ordered) child ids, and from the names, sizes and modification
+        times of the children's content files, as well as those of the
+        source files (and datamodel) of the query's parent.  (For a query
+        of virtual sources, only the files of the record which they
+        belong to are considered.)  No child records are loaded.
+
+        This may be used, e.g., to implement ``get_checksum`` for a
+        virtual source whose content depends only on the query's
+        results.  Note that filters, ordering, and slicing applied to
+        the query are not taken into account, nor are changes to the
+        datamodels of the children.
+
+        """
+        record_path, sep, _ = self.path.partition("@")
+        filenames: list[str] = []
+        with disable_dependency_recording():
+            record = self.pad.get(record_path, alt=self.alt)
+        if record is not None:
+            filenames.extend(iter_source_filenames(record))
+        if not sep:
+            to_fs_path = self.pad.db.to_fs_path
+            for id in self.__child_ids:
+                fs_path = to_fs_path(cleanup_path(f"{self.path}/{id}"))
+                if self.alt != PRIMARY_ALT:
+                    filenames.append(os.path.join(fs_path, f"contents+{self.alt}.lr"))
+                filenames.append(os.path.join(fs_path, "contents.lr"))
+
+        h = hashlib.sha1()
+        h.update(f"{self.path}\0{self.alt}\0".encode("utf-8"))
+        for id in self.__child_ids:
+            h.update(f"{id}\0".encode("utf-8"))
+        h.update(fingerprint_files(filenames).encode("ascii"))
+        return h.hexdigest()
+
+    def union(
+        self, *others: PrecomputedQuery[_DBSourceObject]
+    ) -> PrecomputedQuery[_DBSourceObject]:
+        """A query for the children of this query or any of ``others``.
+
+        The children of this query come first, in order, followed by any
+        additional children from ``others``.
+
+        This, and the other set operations, work only on the child ids
+        of the queries; no records are loaded.  The queries must be
+        pristine (no filters, ordering, etc. applied), and have the same
+        path, alt and pad.  The resulting query is pristine.
+
+        """
+        child_ids = OrderedDict(self.__child_ids)
+        for other in others:
+            child_ids.update(self.__other_child_ids(other))
+        return self.__with_child_ids(child_ids)
+
+    def intersection(
+        self, *others: PrecomputedQuery[_DBSourceObject]
+    ) -> PrecomputedQuery[_DBSourceObject]:
+        """A query for the children of this query which are also
+        children of all of ``others``.
+
+        """
+        others_ids = [self.__other_child_ids(other) for other in others]
+        return self.__with_child_ids(
+            id for id in self.__child_ids if all(id in ids for ids in others_ids)
+        )
+
+    def difference(
+        self, *others: PrecomputedQuery[_DBSourceObject]
+    ) -> PrecomputedQuery[_DBSourceObject]:
+        """A query for the children of this query which are not children
+        of any of ``others``.
+
+        """
+        others_ids = [self.__other_child_ids(other) for other in others]
+        return self.__with_child_ids(
+            id for id in self.__child_ids if not any(id in ids for ids in others_ids)
+        )
+
+    def __or__(self, other: object) -> PrecomputedQuery[_DBSourceObject]:
+        if not isinstance(other, PrecomputedQuery):
+            return NotImplemented
+        return self.union(other)
+
+    def __and__(self, other: object) -> PrecomputedQuery[_DBSourceObject]:
+        if not isinstance(other, PrecomputedQuery):
+            return NotImplemented
+        return self.intersection(other)
+
+    def __sub__(self, other: object) -> PrecomputedQuery[_DBSourceObject]:
+        if not isinstance(other, PrecomputedQuery):
+            return NotImplemented
+        return self.difference(other)
+
+    def __other_child_ids(
+        self, other: PrecomputedQuery[_DBSourceObject]
+    ) -> OrderedDict[str, None]:
+        if (other.path, other.alt, other.pad) != (self.path, self.alt, self.pad):
+            raise ValueError(
+                "set operations require queries with the same path, alt and pad"
+            )
+        other.__assert_is_set_operand()
+        return other.__child_ids
+
+    def __with_child_ids(
+        self, child_ids: Iterable[str]
+    ) -> PrecomputedQuery[_DBSourceObject]:
+        self.__assert_is_set_operand()
+        # Clone, so as to preserve the query's class and any other
+        # settings.
+        rv: PrecomputedQuery[_DBSourceObject] = self._clone()
+        rv.__child_ids = OrderedDict((id_, None) for id_ in child_ids)
+        return rv
+
+    def __assert_is_set_operand(self) -> None:
+        if not self._pristine or self._order_by:
+            raise ValueError("set operations require pristine, unordered queries")
+
     def __bool__(self) -> bool:
         if self._pristine:
             # optimization
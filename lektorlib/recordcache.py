@@ -9,21 +9,37 @@ perfectly capable of caching virtual sources.
 from __future__ import annotations
 
 import sys
+import threading
+import time
+from typing import Any
 from typing import Callable
+from typing import Hashable
+from typing import Iterable
+from typing import Mapping
+from typing import Optional
 from typing import overload
+from typing import Sequence
+from typing import Tuple
 from typing import TYPE_CHECKING
 from typing import TypeVar
 
+from lektorlib.tracing import emit
+from lektorlib.tracing import is_tracing
+from lektorlib.tracing import Span
+
 if sys.version_info >= (3, 10):
     from types import EllipsisType
 elif TYPE_CHECKING:
     from builtins import ellipsis as EllipsisType
 
 if TYPE_CHECKING:
+    from lektor.db import Pad
     from lektor.db import Record
     from lektor.sourceobj import VirtualSourceObject
 
 
+_T = TypeVar("_T")
+_CacheKey = Tuple[str, str, Optional[str]]
 _VSO = TypeVar("_VSO", bound="VirtualSourceObject")
 
 
@@ -33,6 +49,7 @@ def get_or_create_virtual(
     virtual_path: str,
     creator: Callable[[], _VSO],
     persist: bool = True,
+    threadsafe: bool = False,
 ) -> _VSO:
     ...
 
@@ -43,6 +60,7 @@ def get_or_create_virtual(
     virtual_path: str,
     creator: Callable[[], _VSO | None],
     persist: bool = True,
+    threadsafe: bool = False,
 ) -> _VSO | None:
     ...
 
@@ -52,16 +70,440 @@ def get_or_create_virtual(
     virtual_path: str,
     creator: Callable[[], _VSO | None],
     persist: bool = True,
+    threadsafe: bool = False,
 ) -> _VSO | None:
+    """Get a virtual source from the pad's record cache, creating it by
+    calling ``creator`` if it is not there.
+
+    The source is cached under ``virtual_path`` relative to ``record``.
+    (Normally that is the same key under which the record cache would
+    store the source, but it need not be.)  If ``creator`` returns
+    ``None``, that fact is remembered in the cache, too.
+
+    If ``threadsafe`` is set, concurrent calls for the same source
+    (from different threads) will not each call ``creator``.  Instead,
+    one thread creates the source while the others wait for, and then
+    share, its result (or exception.)
+
+    """
     cache = record.pad.cache
     source: VirtualSourceObject | None | EllipsisType
     source = cache.get(record.path, record.alt, virtual_path)
+    if _stats is not None:
+        _stats.record_lookup(virtual_path, source)
     if source is Ellipsis:
-        source = creator()
+        if threadsafe:
+            return _create_single_flight(record, virtual_path, creator, persist)
+        source = _call_creator(record, [virtual_path], creator)
+        _cache_sources(record, {virtual_path: source}, persist)
+    elif _persist_limits:
+        _touch_bounded(record, virtual_path)
+    return source
+
+
+def get_or_create_virtuals(
+    record: Record,
+    virtual_paths: Iterable[str],
+    creator: Callable[[Sequence[str]], Mapping[str, _VSO | None]],
+    persist: bool = True,
+) -> list[_VSO | None]:
+    """Get a number of virtual sources from the pad's record cache,
+    creating any which are not there in a single call to ``creator``.
+
+    The ``creator`` is passed a list of the virtual paths which were not
+    found in the cache.  It should return a mapping from virtual path to
+    source.  Any virtual paths which are missing from the mapping (or
+    which are mapped to ``None``) are remembered in the cache as missing.
+
+    Returns a list of the sources, in the same order as
+    ``virtual_paths``.
+
+    """
+    virtual_paths = list(virtual_paths)
+    cache = record.pad.cache
+    sources: dict[str, _VSO | None] = {}
+    misses: list[str] = []
+    for virtual_path in dict.fromkeys(virtual_paths):
+        source = cache.get(record.path, record.alt, virtual_path)
+        if _stats is not None:
+            _stats.record_lookup(virtual_path, source)
+        if source is Ellipsis:
+            misses.append(virtual_path)
+        else:
+            sources[virtual_path] = source
+            if _persist_limits:
+                _touch_bounded(record, virtual_path)
+    if misses:
+        created = _call_creator(record, misses, creator, misses)
+        new_sources = {vpath: created.get(vpath) for vpath in misses}
+        _cache_sources(record, new_sources, persist)
+        sources.update(new_sources)
+    return [sources[virtual_path] for virtual_path in virtual_paths]
+
+
+class _Flight:
+    """The creation of a source by one thread, which others may wait for."""
+
+    __slots__ = ["done", "source", "exception"]
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.source: Any = None
+        self.exception: BaseException | None = None
+
+
+_flights_lock = threading.Lock()
+
+
+def _create_single_flight(
+    record: Record,
+    virtual_path: str,
+    creator: Callable[[], _VSO | None],
+    persist: bool,
+) -> _VSO | None:
+    cache = record.pad.cache
+    flights = get_pad_cache(record.pad, _Flight)
+    cache_key = _get_cache_key(record.path, record.alt, virtual_path)
+    with _flights_lock:
+        # Another thread may have finished creating the source since we
+        # last looked.
+        source = cache.get(record.path, record.alt, virtual_path)
+        if source is not Ellipsis:
+            return source  # type: ignore[no-any-return]
+        flight = flights.get(cache_key)
+        is_leader = flight is None
+        if flight is None:
+            flight = flights[cache_key] = _Flight()
+
+    if not is_leader:
+        flight.done.wait()
+        if flight.exception is not None:
+            raise flight.exception
+        return flight.source  # type: ignore[no-any-return]
+
+    try:
+        flight.source = _call_creator(record, [virtual_path], creator)
+        _cache_sources(record, {virtual_path: flight.source}, persist)
+        return flight.source  # type: ignore[no-any-return]
+    except BaseException as exc:
+        flight.exception = exc
+        raise
+    finally:
+        with _flights_lock:
+            del flights[cache_key]
+        flight.done.set()
+
+
+def _cache_sources(
+    record: Record,
+    sources: Mapping[str, VirtualSourceObject | None],
+    persist: bool,
+) -> None:
+    """Store newly created sources (or missing markers) in the record cache.
+
+    The sources are stored under the key which they are looked up by:
+    their virtual path relative to ``record``.  (``RecordCache.persist``
+    and ``.remember`` compute the cache key from the path of the source,
+    which might differ.)
+
+    """
+    cache = record.pad.cache
+    persistent = {}
+    bounded: dict[str, list[_CacheKey]] = {}
+    for virtual_path, source in sources.items():
+        if _stats is not None:
+            _stats.record_stored(virtual_path, source, persist)
+        cache_key = _get_cache_key(record.path, record.alt, virtual_path)
+        if persist and source is not None:
+            persistent[cache_key] = source
+            prefix = _get_prefix(virtual_path)
+            if prefix in _persist_limits:
+                bounded.setdefault(prefix, []).append(cache_key)
+        else:
+            # Missing markers are always stored in the ephemeral cache.
+            # (This matches RecordCache.remember_as_missing.)
+            cache.ephemeral[cache_key] = source
+    cache.persistent.update(persistent)
+    for prefix, cache_keys in bounded.items():
+        _add_bounded(record.pad, prefix, cache_keys)
+
+
+def _call_creator(
+    record: Record,
+    virtual_paths: Sequence[str],
+    creator: Callable[..., _T],
+    *args: Any,
+) -> _T:
+    """Call creator, timing the call if statistics are being collected
+    or tracing is enabled.
+
+    """
+    stats = _stats
+    timing = stats is not None and stats.timing
+    if not timing and not is_tracing():
+        return creator(*args)
+    start = time.perf_counter()
+    try:
+        return creator(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        if stats is not None and stats.timing:
+            stats.record_creator_time(virtual_paths, elapsed)
+        if is_tracing():
+            span = Span("create_virtual", record.path)
+            span.duration = elapsed
+            span.loaded = len(virtual_paths)
+            emit(span)
+
+
+def _get_cache_key(path: str, alt: str, virtual_path: str | None) -> _CacheKey:
+    # This matches lektor.db.RecordCache._get_cache_key
+    return path.strip("/"), alt, virtual_path
+
+
+def _get_prefix(virtual_path: str) -> str:
+    """The prefix by which statistics and persistence limits are keyed."""
+    return virtual_path.split("/", 1)[0].split("@", 1)[0]
+
+
+_persist_limits: dict[str, int] = {}
+
+# Guards the LRU bookkeeping for bounded prefixes, which may be updated
+# concurrently when get_or_create_virtual is called with threadsafe=True.
+_lru_lock = threading.Lock()
+
+
+def set_persist_limit(prefix: str, max_count: int | None) -> None:
+    """Limit the number of persisted virtual sources with a given prefix.
+
+    By default, sources cached by ``get_or_create_virtual`` (or
+    ``get_or_create_virtuals``) with ``persist=True`` stay in the pad's
+    persistent cache for the lifetime of the pad.  For a large site,
+    that can add up to a lot of memory.
+
+    This sets a limit on the number of such sources, whose virtual path
+    prefix (the first component of the virtual path) is ``prefix``,
+    which are kept in the persistent cache of each pad.  When the limit
+    is exceeded, the least recently used source is demoted to the
+    (size-bounded) ephemeral section of the record cache.  Once it falls
+    out of that, it will be recreated on its next use.
+
+    Passing ``None`` for ``max_count`` removes the limit.
+
+    """
+    if max_count is None:
+        _persist_limits.pop(prefix, None)
+    elif max_count < 0:
+        raise ValueError("max_count must not be negative")
+    else:
+        _persist_limits[prefix] = max_count
+
+
+def _get_lru(pad: Pad, prefix: str) -> dict[_CacheKey, None]:
+    # An (ordered) dict of the cache keys of the bounded persisted
+    # sources, least recently used first.
+    return get_pad_cache(pad, (set_persist_limit, prefix))
+
+
+def _touch_bounded(record: Record, virtual_path: str) -> None:
+    """Mark a source found in the cache as recently used."""
+    prefix = _get_prefix(virtual_path)
+    if prefix in _persist_limits:
+        lru = _get_lru(record.pad, prefix)
+        cache_key = _get_cache_key(record.path, record.alt, virtual_path)
+        with _lru_lock:
+            if cache_key in lru:
+                del lru[cache_key]
+                lru[cache_key] = None
+
+
+def _add_bounded(pad: Pad, prefix: str, cache_keys: Iterable[_CacheKey]) -> None:
+    """Account for newly persisted sources, evicting old ones if needed."""
+    lru = _get_lru(pad, prefix)
+    max_count = _persist_limits[prefix]
+    cache = pad.cache
+    with _lru_lock:
+        for cache_key in cache_keys:
+            lru.pop(cache_key, None)
+            lru[cache_key] = None
+
+        while len(lru) > max_count:
+            cache_key = next(iter(lru))
+            del lru[cache_key]
+            source = cache.persistent.pop(cache_key, None)
+            if source is not None:
+                cache.ephemeral[cache_key] = source
+                if _stats is not None:
+                    _stats.record_evicted(prefix)
+
+
+def get_pad_cache(pad: Pad, namespace: Hashable) -> dict[Any, Any]:
+    """Get a dict which can be used to cache arbitrary data for the
+    lifetime of a pad.
+
+    A separate dict is returned for each distinct ``namespace``.
+
+    The dicts are stored in an attribute of the pad, so that they are
+    garbage collected along with the pad.  (Were they instead kept in a
+    ``WeakKeyDictionary`` keyed by pad, any cached value which refers
+    back to the pad would keep the pad alive forever.)
+
+    """
+    pad_cache = pad.__dict__.setdefault("_lektorlib_pad_cache", {})
+    return pad_cache.setdefault(namespace, {})  # type: ignore[no-any-return]
+
+
+class PrefixCacheStats:
+    """Record cache statistics for virtual paths sharing a common prefix."""
+
+    __slots__ = [
+        "hits",
+        "missing_hits",
+        "misses",
+        "created",
+        "missing",
+        "persisted",
+        "evicted",
+        "creator_calls",
+        "creator_time",
+    ]
+
+    def __init__(self) -> None:
+        self.hits = 0  # found a source in the cache
+        self.missing_hits = 0  # found a "missing" marker in the cache
+        self.misses = 0  # found nothing in the cache
+        self.created = 0  # number of sources created
+        self.missing = 0  # number of "missing" markers stored
+        self.persisted = 0  # number of sources stored in the persistent cache
+        self.evicted = 0  # number of sources evicted from the persistent cache
+        self.creator_calls = 0  # number of timed calls to creator
+        self.creator_time = 0.0  # total time (seconds) spent in creator
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.missing_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.lookups
+        return (self.hits + self.missing_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        rv: dict[str, float] = {name: getattr(self, name) for name in self.__slots__}
+        rv["lookups"] = self.lookups
+        rv["hit_rate"] = self.hit_rate
+        return rv
+
+
+class CacheStats:
+    """Statistics on the use of the record cache by ``get_or_create_virtual``
+    and ``get_or_create_virtuals``.
+
+    Statistics are broken down by virtual path prefix: the first
+    component of the virtual path.
+
+    If ``timing`` is set, the time spent in calls to ``creator`` is
+    measured, too.  When ``get_or_create_virtuals`` creates sources for
+    more than one virtual path in a single call, the time is divided
+    evenly between those virtual paths.
+
+    """
+
+    def __init__(self, timing: bool = False):
+        self.timing = timing
+        self.by_prefix: dict[str, PrefixCacheStats] = {}
+
+    def reset(self) -> None:
+        """Reset all statistics (e.g. at the start of a build)."""
+        self.by_prefix.clear()
+
+    def _for_prefix(self, prefix: str) -> PrefixCacheStats:
+        try:
+            return self.by_prefix[prefix]
+        except KeyError:
+            return self.by_prefix.setdefault(prefix, PrefixCacheStats())
+
+    def _for_virtual_path(self, virtual_path: str) -> PrefixCacheStats:
+        return self._for_prefix(_get_prefix(virtual_path))
+
+    def record_lookup(self, virtual_path: str, source: object) -> None:
+        stats = self._for_virtual_path(virtual_path)
+        if source is Ellipsis:
+            stats.misses += 1
+        elif source is None:
+            stats.missing_hits += 1
+        else:
+            stats.hits += 1
+
+    def record_stored(self, virtual_path: str, source: object, persist: bool) -> None:
+        stats = self._for_virtual_path(virtual_path)
         if source is None:
-            cache.remember_as_missing(record.path, record.alt, virtual_path)
-        elif persist:
-            cache.persist(source)
+            stats.missing += 1
         else:
-            cache.remember(source)
-    return source
+            stats.created += 1
+            if persist:
+                stats.persisted += 1
+
+    def record_evicted(self, prefix: str) -> None:
+        self._for_prefix(prefix).evicted += 1
+
+    def record_creator_time(self, virtual_paths: Sequence[str], elapsed: float) -> None:
+        share = elapsed / len(virtual_paths)
+        for stats in set(map(self._for_virtual_path, virtual_paths)):
+            stats.creator_calls += 1
+        for virtual_path in virtual_paths:
+            self._for_virtual_path(virtual_path).creator_time += share
+
+    def report(self) -> str:
+        """Format a report of the statistics.
+
+        Prefixes are listed in order of increasing hit rate.  Prefixes
+        with equal hit rates are listed in order of decreasing time
+        spent in ``creator``.
+
+        """
+        lines = [
+            f"{'prefix':<24} {'lookups':>8} {'hit rate':>8} {'misses':>8}"
+            f" {'missing':>8} {'persisted':>9} {'evicted':>8} {'creator time':>12}"
+        ]
+        for prefix, stats in sorted(
+            self.by_prefix.items(),
+            key=lambda item: (item[1].hit_rate, -item[1].creator_time, item[0]),
+        ):
+            lines.append(
+                f"{prefix:<24} {stats.lookups:>8d} {stats.hit_rate:>8.1%}"
+                f" {stats.misses:>8d} {stats.missing:>8d} {stats.persisted:>9d}"
+                f" {stats.evicted:>8d} {stats.creator_time:>11.3f}s"
+            )
+        return "\n".join(lines)
+
+
+_stats: CacheStats | None = None
+
+
+def enable_cache_stats(timing: bool = False) -> CacheStats:
+    """Start collecting record cache statistics.
+
+    Returns the ``CacheStats`` instance in which the statistics are
+    collected.  A plugin might, e.g., reset it at the start of each
+    build (in ``on_before_build_all``) and log its report at the end (in
+    ``on_after_build_all``.)
+
+    """
+    global _stats
+    _stats = CacheStats(timing=timing)
+    return _stats
+
+
+def disable_cache_stats() -> None:
+    """Stop collecting record cache statistics."""
+    global _stats
+    _stats = None
+
+
+def get_cache_stats() -> CacheStats | None:
+    """Get the current ``CacheStats``, or ``None`` if statistics are not
+    being collected.
+
+    """
+    return _stats
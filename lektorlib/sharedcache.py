@@ -0,0 +1,101 @@
+"""An in-memory cache of virtual sources which is shared between pads.
+
+The Lektor record cache lives only as long as its pad.  The development
+server (``lektor server``) creates a fresh pad for nearly every request,
+so any virtual sources memoized in the record cache are rebuilt over
+and over.  This provides a second-level cache, kept in memory, which
+outlives the pads, so that virtual sources may be reused by later
+requests.
+
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any
+from typing import ClassVar
+from typing import Iterable
+from typing import NamedTuple
+from typing import Sequence
+from typing import TYPE_CHECKING
+
+from lektorlib.sourcecache import _Key
+from lektorlib.sourcecache import SourceCache
+
+if TYPE_CHECKING:
+    from lektor.environment import Environment
+
+
+class _Entry(NamedTuple):
+    filenames: frozenset[str]
+    fingerprint: str
+    state: Any  # None if the source is missing
+
+
+class SharedCache(SourceCache):
+    """An in-memory cache of virtual sources, shared between pads.
+
+    Entries may also be discarded explicitly, e.g. in response to
+    file-change notifications, by calling ``invalidate``.
+
+    The states returned by ``dump`` are shared by all pads which use
+    the cache, so they should not be mutated.
+
+    """
+
+    _instances: ClassVar[dict[str, SharedCache]] = {}
+    _instances_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._entries: dict[_Key, _Entry] = {}
+
+    @classmethod
+    def for_env(cls, env: Environment) -> SharedCache:
+        """Get the shared cache for a project.
+
+        The same cache is returned for all environments of a given
+        project.
+
+        """
+        with cls._instances_lock:
+            shared_cache = cls._instances.get(env.project.id)
+            if shared_cache is None:
+                shared_cache = cls._instances[env.project.id] = cls()
+            return shared_cache
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Discard all cache entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, filenames: Iterable[str | os.PathLike[str]]) -> None:
+        """Discard the entries which depend on any of ``filenames``."""
+        changed = {os.path.abspath(filename) for filename in filenames}
+        with self._lock:
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if entry.filenames.isdisjoint(changed)
+            }
+
+    def _load_entry(self, key: _Key, fingerprint: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry.fingerprint != fingerprint:
+            return Ellipsis
+        return entry.state
+
+    def _store_entry(
+        self, key: _Key, fingerprint: str, filenames: Sequence[str], state: Any
+    ) -> None:
+        entry = _Entry(
+            frozenset(os.path.abspath(filename) for filename in filenames),
+            fingerprint,
+            state,
+        )
+        with self._lock:
+            self._entries[key] = entry
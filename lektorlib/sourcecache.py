@@ -0,0 +1,124 @@
+"""A base class for second-level caches of virtual sources.
+
+The Lektor record cache lives only as long as its pad.  A second-level
+cache outlives the pad, so that expensive-to-compute virtual sources
+may be reused by later pads, so long as the source files they depend
+on have not changed.
+
+Virtual sources generally hold references to their records (and so to
+their pads), so they can not be stored as is.  Instead, the caller
+provides a ``dump`` function, which extracts the state required to
+reconstruct a virtual source, and a ``load`` function, which
+reconstructs the virtual source (for a record from the current pad)
+from that state.
+
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Sequence
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import TypeVar
+
+from lektorlib.fingerprint import fingerprint_files
+from lektorlib.fingerprint import iter_source_filenames
+from lektorlib.recordcache import get_or_create_virtual
+
+if TYPE_CHECKING:
+    from lektor.db import Record
+    from lektor.sourceobj import VirtualSourceObject
+
+
+_VSO = TypeVar("_VSO", bound="VirtualSourceObject")
+
+# (record path, alt, virtual path)
+_Key = Tuple[str, str, str]
+
+
+class SourceCache:
+    """Base class for second-level caches of virtual sources.
+
+    Entries are keyed by record path, alt and virtual path.  Each entry
+    also records a fingerprint of the source files it was computed from.
+    An entry is only used if that fingerprint still matches.
+
+    Subclasses provide the storage for the entries by implementing
+    ``_load_entry`` and ``_store_entry``.
+
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def _load_entry(self, key: _Key, fingerprint: str) -> Any:
+        """Look up the state stored for ``key``.
+
+        Returns ``Ellipsis`` if there is no entry with a matching
+        ``fingerprint``.  The state of a missing source is ``None``.
+
+        """
+        raise NotImplementedError()
+
+    def _store_entry(
+        self, key: _Key, fingerprint: str, filenames: Sequence[str], state: Any
+    ) -> None:
+        """Store the state for ``key``, replacing any existing entry.
+
+        ``filenames`` are the files from which ``fingerprint`` was
+        computed.
+
+        """
+        raise NotImplementedError()
+
+    def get_or_create_virtual(
+        self,
+        record: Record,
+        virtual_path: str,
+        creator: Callable[[], _VSO | None],
+        dump: Callable[[_VSO], Any],
+        load: Callable[[Record, Any], _VSO],
+        dependencies: Iterable[str] = (),
+        persist: bool = True,
+    ) -> _VSO | None:
+        """Like ``lektorlib.recordcache.get_or_create_virtual``, but
+        backed by this cache.
+
+        The pad's record cache is checked first.  On a miss, if this
+        cache holds an up-to-date entry, the source is reconstructed from
+        it by calling ``load(record, state)``.  Otherwise, ``creator`` is
+        called, and ``dump(source)`` is stored in this cache.
+
+        An entry is considered up-to-date if none of the source files of
+        ``record`` (nor its datamodel file), nor any of the files listed
+        in ``dependencies`` have changed since the entry was stored.
+
+        """
+
+        def cached_creator() -> _VSO | None:
+            filenames = list(iter_source_filenames(record))
+            filenames.extend(dependencies)
+            fingerprint = fingerprint_files(filenames)
+            key = (record.path, record.alt, virtual_path)
+
+            state = self._load_entry(key, fingerprint)
+            if state is None:
+                return None  # remembered as missing
+            if state is not Ellipsis:
+                try:
+                    return load(record, state)
+                except Exception:
+                    pass  # stale or corrupt entry; recompute it
+
+            source = creator()
+            state = None if source is None else dump(source)
+            self._store_entry(key, fingerprint, filenames, state)
+            return source
+
+        source: _VSO | None = get_or_create_virtual(
+            record, virtual_path, cached_creator, persist=persist
+        )
+        return source
@@ -3,15 +3,25 @@
 """
 from __future__ import annotations
 
+import datetime
+import os
+import random
 import re
+from collections import Counter
 from contextlib import contextmanager
+from pathlib import Path
 from typing import Generator
+from typing import Mapping
+from typing import Sequence
 from typing import TYPE_CHECKING
 
+import lektor.environment
+import lektor.project
 from lektor.context import get_ctx
+from lektor.sourceobj import VirtualSourceObject
 
 if TYPE_CHECKING:
-    from lektor.sourceobj import VirtualSourceObject
+    from lektor.db import Record
 
 
 @contextmanager
@@ -27,3 +37,348 @@ def assert_no_dependencies(
 
     with get_ctx().gather_dependencies(check_dep):
         yield
+
+
+class DependencyCounter:
+    """Collects the distinct dependencies recorded within a context."""
+
+    def __init__(self) -> None:
+        self.dependencies: dict[str, str | VirtualSourceObject] = {}
+
+    def __call__(self, dep: str | VirtualSourceObject) -> None:
+        self.dependencies.setdefault(_dependency_path(dep), dep)
+
+    def __len__(self) -> int:
+        return len(self.dependencies)
+
+    def count(self, match: str | re.Pattern[str] | None = None) -> int:
+        """Count the dependencies whose filename (or virtual source path)
+        matches a regular expression.
+
+        """
+        if match is None:
+            return len(self)
+        return sum(1 for path in self.dependencies if re.search(match, path))
+
+    def top_offenders(self, n: int = 10) -> list[tuple[str, int]]:
+        """The groups of similar dependencies with the most members.
+
+        File dependencies are grouped by the grandparent directory (so
+        that, e.g., the ``contents.lr`` of all the children of a given
+        record are grouped together.)  Virtual source dependencies are
+        grouped by the parent of their virtual path.
+
+        """
+        groups = Counter(map(_dependency_group, self.dependencies))
+        return groups.most_common(n)
+
+    def report(self, n: int = 10) -> str:
+        lines = [f"{len(self)} dependencies recorded. Top offenders:"]
+        lines.extend(f"{count:>8d}  {group}" for group, count in self.top_offenders(n))
+        return "\n".join(lines)
+
+
+def _dependency_path(dep: str | VirtualSourceObject) -> str:
+    return dep if isinstance(dep, str) else dep.path
+
+
+def _dependency_group(path: str) -> str:
+    if "@" in path:
+        record_path, _, virtual_path = path.partition("@")
+        parent, sep, _ = virtual_path.rpartition("/")
+        return f"{record_path}@{parent}{sep}*"
+    subdir, filename = os.path.split(path)
+    return os.path.join(os.path.dirname(subdir), "*", filename)
+
+
+@contextmanager
+def assert_dependency_budget(
+    max_dependencies: int | None = None,
+    groups: Mapping[str | re.Pattern[str], int] | None = None,
+    top: int = 10,
+) -> Generator[DependencyCounter, None, None]:
+    """Assert that the number of dependencies recorded within the context
+    does not exceed a budget.
+
+    At most ``max_dependencies`` distinct dependencies may be recorded
+    in total.  Additionally, ``groups`` may map regular expressions to
+    the maximum number of dependencies which may match each.
+
+    If any budget is exceeded, the ``AssertionError`` includes a report
+    of the ``top`` groups of offending dependencies.
+
+    """
+    counter = DependencyCounter()
+    with get_ctx().gather_dependencies(counter):
+        yield counter
+
+    failures = []
+    if max_dependencies is not None and len(counter) > max_dependencies:
+        failures.append(f"{len(counter)} dependencies > {max_dependencies}")
+    for match, budget in (groups or {}).items():
+        count = counter.count(match)
+        if count > budget:
+            pattern = match if isinstance(match, str) else match.pattern
+            failures.append(f"{count} dependencies matching {pattern!r} > {budget}")
+    if failures:
+        raise AssertionError(
+            "Dependency budget exceeded: "
+            + "; ".join(failures)
+            + "\n"
+            + counter.report(top)
+        )
+
+
+_WORDS = """
+    lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod
+    tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam
+    quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo
+    consequat duis aute irure in reprehenderit voluptate velit esse cillum
+    fugiat nulla pariatur excepteur sint occaecat cupidatat non proident
+    sunt culpa qui officia deserunt mollit anim id est laborum
+""".split()
+
+_CATEGORIES = ["news", "misc", "release", "howto", "opinion"]
+
+_TAGS = [f"tag-{n:02d}" for n in range(50)]
+
+_MODELS = {
+    "page.ini": """
+        [model]
+        name = Page
+        label = {{ this.title }}
+
+        [fields.title]
+        type = string
+
+        [fields.body]
+        type = markdown
+    """,
+    "blog.ini": """
+        [model]
+        name = Blog
+        label = {{ this.title }}
+
+        [children]
+        model = blog-post
+        order_by = -pub_date, title
+
+        [pagination]
+        enabled = {pagination_enabled}
+        per_page = {per_page}
+
+        [fields.title]
+        type = string
+    """,
+    "blog-post.ini": """
+        [model]
+        name = Blog Post
+        label = {{ this.title }}
+
+        [fields.title]
+        type = string
+
+        [fields.pub_date]
+        type = date
+
+        [fields.category]
+        type = string
+
+        [fields.tags]
+        type = strings
+
+        [fields.body]
+        type = markdown
+    """,
+}
+
+_TEMPLATES = {
+    "page.html": "<h1>{{ this.title }}</h1>{{ this.body }}",
+    "blog.html": (
+        "<h1>{{ this.title }}</h1><ul>"
+        "{% for child in (this.pagination.items if this.pagination else"
+        " this.children) %}"
+        '<li><a href="{{ child|url }}">{{ child.title }}</a></li>'
+        "{% endfor %}</ul>"
+    ),
+    "blog-post.html": "<h1>{{ this.title }}</h1>{{ this.body }}",
+}
+
+
+def generate_site(
+    path: str | os.PathLike[str],
+    pages: int = 1000,
+    depth: int = 1,
+    fanout: int = 10,
+    per_page: int | None = None,
+    alts: Sequence[str] = (),
+    seed: int = 0,
+) -> Path:
+    """Generate a synthetic Lektor project, e.g. for performance testing.
+
+    The project is written to the directory ``path``.  It contains a
+    ``/blog`` containing a total of ``pages`` blog posts with
+    (pseudo-)random titles, publication dates, categories, tags and
+    bodies.
+
+    If ``depth`` is greater than one, the posts are distributed among a
+    tree of nested sections (each of which has ``fanout`` children), so
+    that the posts are ``depth`` levels below ``/blog``.
+
+    If ``per_page`` is set, pagination is enabled for ``/blog`` and its
+    sections.  If ``alts`` are given, the project is configured with
+    those alternatives (the first one being the primary alt), and
+    translated content is generated for each of them.
+
+    Returns the path to the project directory.
+
+    """
+    site = Path(path)
+    rnd = random.Random(seed)
+    primary_alt = alts[0] if alts else None
+
+    def write(relpath: str, text: str) -> None:
+        filename = site / relpath
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(text, encoding="utf-8")
+
+    def words(n: int) -> str:
+        return " ".join(rnd.choice(_WORDS) for _ in range(n))
+
+    def write_contents(relpath: str, fields: dict[str, str]) -> None:
+        text = "\n---\n".join(
+            f"{name}:\n\n{value}" if "\n" in value else f"{name}: {value}"
+            for name, value in fields.items()
+        )
+        write(f"content/{relpath}/contents.lr", text + "\n")
+        for alt in alts[1:]:
+            alt_fields = {"title": f"[{alt}] {fields['title']}"}
+            text = "".join(f"{name}: {value}\n" for name, value in alt_fields.items())
+            write(f"content/{relpath}/contents+{alt}.lr", text)
+
+    project = ["[project]", "name = Synthetic Site", ""]
+    for alt in alts:
+        project.append(f"[alternatives.{alt}]")
+        project.append(f"name = {alt}")
+        if alt == primary_alt:
+            project.append("primary = yes")
+        else:
+            project.append(f"url_prefix = /{alt}/")
+        project.append("")
+    write("Synthetic Site.lektorproject", "\n".join(project))
+
+    for filename, model in _MODELS.items():
+        model = "\n".join(line.strip() for line in model.strip().splitlines())
+        if filename == "blog.ini":
+            model = model.replace(
+                "{pagination_enabled}", "yes" if per_page else "no"
+            ).replace("{per_page}", str(per_page or 20))
+        write(f"models/{filename}", model + "\n")
+    for filename, template in _TEMPLATES.items():
+        write(f"templates/{filename}", template + "\n")
+
+    write_contents("", {"title": "Synthetic Site", "body": words(20)})
+    write_contents("blog", {"_model": "blog", "title": "Blog"})
+
+    n_leaves = fanout ** (depth - 1)
+    sections: set[str] = set()
+    width = max(5, len(str(pages - 1)))
+    start_date = datetime.date(2000, 1, 1)
+    for n in range(pages):
+        leaf = n % n_leaves
+        section = "blog"
+        for level in reversed(range(depth - 1)):
+            section += f"/section-{leaf // fanout**level % fanout:02d}"
+            if section not in sections:
+                sections.add(section)
+                title = f"Section {section[5:]}"
+                write_contents(section, {"_model": "blog", "title": title})
+
+        pub_date = start_date + datetime.timedelta(days=rnd.randrange(8000))
+        body = "\n\n".join(
+            words(rnd.randrange(20, 60)).capitalize() + "."
+            for _ in range(rnd.randrange(1, 5))
+        )
+        write_contents(
+            f"{section}/post-{n:0{width}d}",
+            {
+                "title": words(rnd.randrange(2, 7)).title(),
+                "pub_date": pub_date.isoformat(),
+                "category": rnd.choice(_CATEGORIES),
+                "tags": "\n".join(rnd.sample(_TAGS, rnd.randrange(0, 5))),
+                "body": body,
+            },
+        )
+    return site
+
+
+def make_env(
+    path: str | os.PathLike[str], load_plugins: bool = False
+) -> lektor.environment.Environment:
+    """Make a Lektor environment for the project in ``path``."""
+    project = lektor.project.Project.from_path(os.fspath(path))
+    return lektor.environment.Environment(project, load_plugins=load_plugins)
+
+
+class SyntheticVirtualSource(VirtualSourceObject):  # type: ignore[misc]
+    """A trivial virtual source, as resolved by the resolvers registered
+    by ``register_virtual_path_resolver``.
+
+    These support pagination, to the extent required by
+    ``lektorlib.query.get_source``.  Paginated sources have a virtual
+    path of the form ``<prefix>/<name>/page/<page_num>``.
+
+    """
+
+    def __init__(
+        self, record: Record, prefix: str, name: str, page_num: int | None = None
+    ):
+        super().__init__(record)
+        self.prefix = prefix
+        self.name = name
+        self.page_num = page_num
+
+    @property
+    def path(self) -> str:
+        path = f"{self.record.path}@{self.prefix}/{self.name}"
+        if self.page_num is not None:
+            path += f"/page/{self.page_num:d}"
+        return path
+
+    @property
+    def pagination(self) -> SyntheticPagination:
+        return SyntheticPagination(self)
+
+
+class SyntheticPagination:
+    def __init__(self, source: SyntheticVirtualSource):
+        self.source = source
+
+    def for_page(self, page_num: int) -> SyntheticVirtualSource:
+        source = self.source
+        return SyntheticVirtualSource(
+            source.record, source.prefix, source.name, page_num
+        )
+
+
+def register_virtual_path_resolver(
+    env: lektor.environment.Environment, prefix: str = "synthetic"
+) -> None:
+    """Register a virtual path resolver for ``prefix``.
+
+    Any virtual path of the form ``<prefix>/<name>`` (or
+    ``<prefix>/<name>/page/<page_num>``) resolves to a
+    ``SyntheticVirtualSource``.
+
+    """
+
+    def resolve(record: Record, pieces: list[str]) -> SyntheticVirtualSource | None:
+        page_num = None
+        if len(pieces) >= 2 and pieces[-2] == "page" and pieces[-1].isdigit():
+            page_num = int(pieces[-1])
+            pieces = pieces[:-2]
+        if not pieces:
+            return None
+        return SyntheticVirtualSource(record, prefix, "/".join(pieces), page_num)
+
+    env.virtualpathresolver(prefix)(resolve)
@@ -0,0 +1,191 @@
+"""Lightweight tracing of lektorlib's hot paths.
+
+When enabled, ``PrecomputedQuery`` iteration, ``get_source``, and the
+``creator`` calls made by ``get_or_create_virtual`` (and
+``get_or_create_virtuals``) each report a ``Span`` to the registered
+trace hooks.  When no hooks are registered, the cost of this is a
+single check per call.
+
+A ``Profile`` is a trace hook which aggregates spans into a per-build
+profile report.  A plugin might, e.g., add one as a hook at the start of
+a build (in ``on_before_build_all``) and log its report at the end (in
+``on_after_build_all``.)
+
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Generator
+from typing import Tuple
+
+TraceHook = Callable[["Span"], None]
+
+_hooks: tuple[TraceHook, ...] = ()
+
+
+class Span:
+    """Timing and counts for a single traced call.
+
+    ``name`` identifies the traced operation (``"iterate"``,
+    ``"get_source"`` or ``"create_virtual"``), and ``path`` is the path
+    of the parent of the sources involved: the path of the query, the
+    parent of the source loaded, or the record a virtual source is
+    created for.
+
+    ``loaded`` is the number of sources loaded (or created), and
+    ``yielded`` the number of those returned to the caller.
+    ``filter_time`` is the part of ``duration`` spent filtering
+    sources.  For ``"iterate"`` spans, ``duration`` includes only the
+    time spent within the iterator, not that spent by its consumer.
+
+    """
+
+    __slots__ = ["name", "path", "duration", "loaded", "yielded", "filter_time"]
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.duration = 0.0
+        self.loaded = 0
+        self.yielded = 0
+        self.filter_time = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} {self.name} {self.path!r}"
+            f" {self.duration:.6f}s loaded={self.loaded} yielded={self.yielded}>"
+        )
+
+
+def add_trace_hook(hook: TraceHook) -> None:
+    """Register a callable to be called with each completed ``Span``.
+
+    Hooks may be called from multiple threads.
+
+    """
+    global _hooks
+    _hooks = _hooks + (hook,)
+
+
+def remove_trace_hook(hook: TraceHook) -> None:
+    """Unregister a trace hook."""
+    global _hooks
+    hooks = list(_hooks)
+    hooks.remove(hook)
+    _hooks = tuple(hooks)
+
+
+def is_tracing() -> bool:
+    """Check whether any trace hooks are registered."""
+    return bool(_hooks)
+
+
+def emit(span: Span) -> None:
+    """Report a completed span to the registered trace hooks."""
+    for hook in _hooks:
+        hook(span)
+
+
+@contextmanager
+def trace(name: str, path: str) -> Generator[Span, None, None]:
+    """Time the body of the context, reporting it as a ``Span``.
+
+    The span is reported even if the body raises an exception.
+
+    """
+    span = Span(name, path)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.duration += time.perf_counter() - start
+        emit(span)
+
+
+class ProfileEntry:
+    """Aggregated spans for a given operation and path."""
+
+    __slots__ = ["calls", "duration", "loaded", "yielded", "filter_time"]
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.duration = 0.0
+        self.loaded = 0
+        self.yielded = 0
+        self.filter_time = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+
+_ProfileKey = Tuple[str, str]
+
+
+class Profile:
+    """A trace hook which aggregates spans by operation and path."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.entries: dict[_ProfileKey, ProfileEntry] = {}
+
+    def __call__(self, span: Span) -> None:
+        with self._lock:
+            entry = self.entries.get((span.name, span.path))
+            if entry is None:
+                entry = self.entries[span.name, span.path] = ProfileEntry()
+            entry.calls += 1
+            entry.duration += span.duration
+            entry.loaded += span.loaded
+            entry.yielded += span.yielded
+            entry.filter_time += span.filter_time
+
+    def reset(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+    def as_dict(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """The profile, as nested dicts, keyed by operation then path."""
+        result: dict[str, dict[str, dict[str, Any]]] = {}
+        for (name, path), entry in sorted(self.entries.items()):
+            result.setdefault(name, {})[path] = entry.as_dict()
+        return result
+
+    def report(self, top: int | None = None) -> str:
+        """Format a report of the profile.
+
+        Entries are listed in order of decreasing total time.  If
+        ``top`` is given, only that many entries are listed.
+
+        Note that times are inclusive: e.g. the time spent in
+        ``get_source`` while iterating over a query is also counted in
+        the time of the ``iterate`` entry for the query.
+
+        """
+        lines = [
+            f"{'operation':<16} {'path':<32} {'calls':>8} {'time':>10}"
+            f" {'filter time':>11} {'loaded':>8} {'yielded':>8}"
+        ]
+        entries = sorted(
+            self.entries.items(), key=lambda item: (-item[1].duration, item[0])
+        )
+        for (name, path), entry in entries[:top]:
+            lines.append(
+                f"{name:<16} {path:<32} {entry.calls:>8d} {entry.duration:>9.3f}s"
+                f" {entry.filter_time:>10.3f}s {entry.loaded:>8d} {entry.yielded:>8d}"
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile() -> Generator[Profile, None, None]:
+    """Collect a ``Profile`` of the traced calls made within the context."""
+    profile = Profile()
+    add_trace_hook(profile)
+    try:
+        yield profile
+    finally:
+        remove_trace_hook(profile)
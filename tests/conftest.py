@@ -1,3 +1,6 @@
+import json
+import platform
+import sys
 from pathlib import Path
 
 import lektor.builder
@@ -8,6 +11,91 @@ import lektor.environment
 import lektor.pagination
 import lektor.project
 import pytest
+from lektor.sourceobj import VirtualSourceObject
+
+if sys.version_info >= (3, 8):
+    import importlib.metadata as importlib_metadata
+else:
+    import importlib_metadata
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", help="run benchmarks (slow)")
+    parser.addoption(
+        "--benchmark-json",
+        metavar="PATH",
+        help="write benchmark results, in JSON format, to PATH",
+    )
+    parser.addoption(
+        "--benchmark-baseline",
+        metavar="PATH",
+        help="compare benchmark results to a baseline written by --benchmark-json",
+    )
+
+
+benchmark_results_key = pytest.StashKey[dict]()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: benchmark test, only run if --benchmark is given"
+    )
+    config.stash[benchmark_results_key] = {}
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="need --benchmark option to run")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture
+def benchmark_report(request):
+    """Record benchmark timings (in seconds) for the current test."""
+    results = request.config.stash[benchmark_results_key]
+
+    def report(**timings):
+        results.setdefault(request.node.nodeid, {}).update(timings)
+
+    return report
+
+
+def pytest_sessionfinish(session):
+    results = session.config.stash[benchmark_results_key]
+    filename = session.config.getoption("--benchmark-json")
+    if results and filename:
+        data = {
+            "python": platform.python_version(),
+            "lektor": importlib_metadata.version("lektor"),
+            "results": results,
+        }
+        Path(filename).write_text(json.dumps(data, indent=2, sort_keys=True))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash[benchmark_results_key]
+    if not results:
+        return
+    baseline = {}
+    baseline_filename = config.getoption("--benchmark-baseline")
+    if baseline_filename:
+        baseline = json.loads(Path(baseline_filename).read_text())["results"]
+
+    terminalreporter.section("benchmark results")
+    for nodeid, timings in results.items():
+        terminalreporter.write_line(nodeid)
+        for name, seconds in timings.items():
+            line = f"    {name:<24} {seconds * 1000:10.2f}ms"
+            base = baseline.get(nodeid, {}).get(name)
+            if base:
+                ratio = seconds / base
+                line += f"  (baseline {base * 1000:10.2f}ms, {ratio:5.2f}x)"
+                terminalreporter.write_line(line, red=ratio > 1.1, green=ratio < 0.9)
+            else:
+                terminalreporter.write_line(line)
 
 
 @pytest.fixture(scope="session")
@@ -45,3 +133,70 @@ def lektor_build_state(lektor_builder):
 def lektor_context(lektor_pad):
     with lektor.context.Context(pad=lektor_pad) as ctx:
         yield ctx
+
+
+class DummyVirtualSource(VirtualSourceObject):
+    def __init__(self, record, virtual_path, data):
+        VirtualSourceObject.__init__(self, record)
+        self._virtual_path = virtual_path
+        self.data = data
+
+    @property
+    def path(self):
+        return f"{self.record.path}@{self._virtual_path}"
+
+
+def dump_dummy_virtual_source(source):
+    return (source._virtual_path, source.data)
+
+
+def load_dummy_virtual_source(record, state):
+    return DummyVirtualSource(record, *state)
+
+
+@pytest.fixture
+def dependency(tmp_path):
+    dependency = tmp_path / "dependency"
+    dependency.write_text("data")
+    return dependency
+
+
+@pytest.fixture
+def new_record(lektor_pad):
+    def new_record(path="/about", alt=None):
+        # Each call returns the record from a fresh pad (with an empty
+        # record cache.)
+        pad = lektor_pad.db.new_pad()
+        new_record.pads.append(pad)
+        return pad.get(path, alt=alt)
+
+    new_record.pads = []
+    return new_record
+
+
+@pytest.fixture
+def get_cached_virtual(source_cache, dependency):
+    """Get a ``DummyVirtualSource`` via ``source_cache``.
+
+    The test module must provide the ``source_cache`` fixture.
+
+    """
+
+    def get(record, virtual_path="vpath", data="data"):
+        def creator():
+            get.calls.append(virtual_path)
+            if data is not None:
+                return DummyVirtualSource(record, virtual_path, data)
+            return None
+
+        return source_cache.get_or_create_virtual(
+            record,
+            virtual_path,
+            creator,
+            dump=dump_dummy_virtual_source,
+            load=load_dummy_virtual_source,
+            dependencies=[str(dependency)],
+        )
+
+    get.calls = []
+    return get
@@ -0,0 +1,224 @@
+"""Benchmarks
+
+These are skipped unless pytest is run with the ``--benchmark`` option.
+
+Use ``--benchmark-json=PATH`` to save the results, and
+``--benchmark-baseline=PATH`` to compare them against previously saved
+results.
+
+"""
+import time
+from functools import partial
+
+import lektor.context
+import lektor.db
+import pytest
+from lektor.db import F
+
+from lektorlib.context import DependencyIgnoringContextProxy
+from lektorlib.context import disable_dependency_recording
+from lektorlib.query import get_source
+from lektorlib.query import PrecomputedQuery
+from lektorlib.recordcache import get_or_create_virtual
+from lektorlib.testing import generate_site
+from lektorlib.testing import make_env
+from lektorlib.testing import register_virtual_path_resolver
+from lektorlib.testing import SyntheticVirtualSource
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [1000, 10000]
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: f"{size}-pages")
+def site_size(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def large_site_path(tmp_path_factory, site_size):
+    site = tmp_path_factory.mktemp(f"site-{site_size}")
+    return generate_site(site, pages=site_size, per_page=20)
+
+
+@pytest.fixture
+def make_pad(large_site_path):
+    env = make_env(large_site_path)
+    register_virtual_path_resolver(env, "bench")
+
+    def make_pad():
+        return lektor.db.Database(env).new_pad()
+
+    return make_pad
+
+
+@pytest.fixture
+def child_ids(site_size):
+    return [f"post-{n:05d}" for n in range(site_size)]
+
+
+def best_time(func, setup=lambda: None, repeat=3):
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        t0 = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+@pytest.mark.parametrize("warm", [False, True])
+@pytest.mark.parametrize("path", ["/blog", "/blog@bench"])
+def test_precomputed_query_batch_loading(
+    make_pad, child_ids, benchmark_report, path, warm
+):
+    def setup():
+        pad = make_pad()
+        if warm:
+            for id in child_ids:
+                source = pad.get(f"{path}/{id}", persist=True)
+                pad.cache.persist(source)
+        return PrecomputedQuery(path, pad, child_ids)
+
+    def per_id(query):
+        for id in child_ids:
+            assert query._get(id, persist=False) is not None
+
+    def batched(query):
+        assert None not in query._get_batch(child_ids, persist=False)
+
+    benchmark_report(
+        per_id=best_time(per_id, setup),
+        batched=best_time(batched, setup),
+    )
+
+
+@pytest.mark.parametrize(
+    "operation", ["iterate", "count", "get", "filter", "order_by", "limit"]
+)
+def test_precomputed_query(make_pad, child_ids, benchmark_report, operation):
+    def setup():
+        # Warm the record cache, so that we are not just timing the
+        # parsing of the .lr files
+        pad = make_pad()
+        for id in child_ids:
+            pad.cache.persist(pad.get(f"/blog/{id}"))
+        return PrecomputedQuery("/blog", pad, child_ids)
+
+    def iterate(query):
+        assert len(list(query)) == len(child_ids)
+
+    def count(query):
+        query.count()
+        query.filter(F.category == "news").count()
+
+    def get(query):
+        for id in child_ids[::10]:
+            assert query.get(id) is not None
+
+    def filter(query):
+        list(query.filter(F.category == "news"))
+
+    def order_by(query):
+        list(query.order_by("-pub_date", "title"))
+        list(query.order_by("-pub_date", "title"))
+
+    def limit(query):
+        list(query.order_by("-pub_date", "title").limit(10))
+
+    operations = {
+        "iterate": iterate,
+        "count": count,
+        "get": get,
+        "filter": filter,
+        "order_by": order_by,
+        "limit": limit,
+    }
+    benchmark_report(**{operation: best_time(operations[operation], setup)})
+
+
+def test_get_source_paginated(make_pad, child_ids, benchmark_report):
+    paths = [f"/blog@bench/{id}" for id in child_ids]
+
+    def get_all(pad):
+        for path in paths:
+            assert get_source(pad, path, page_num=2) is not None
+
+    def warm_pad():
+        pad = make_pad()
+        get_all(pad)
+        return pad
+
+    benchmark_report(
+        miss=best_time(get_all, make_pad),
+        hit=best_time(get_all, warm_pad),
+    )
+
+
+def test_get_or_create_virtual(make_pad, child_ids, benchmark_report):
+    def create_all(pad):
+        record = pad.get("/blog")
+        for id in child_ids:
+            creator = partial(SyntheticVirtualSource, record, "bench", id)
+            get_or_create_virtual(record, id, creator)
+
+    def warm_pad():
+        pad = make_pad()
+        create_all(pad)
+        return pad
+
+    benchmark_report(
+        miss=best_time(create_all, make_pad),
+        hit=best_time(create_all, warm_pad),
+    )
+
+
+class ForwardingContextProxy(DependencyIgnoringContextProxy):
+    """A proxy which forwards all attribute access via ``__getattr__``.
+
+    (This is how ``DependencyIgnoringContextProxy`` used to work.)
+    """
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+
+
+CTX_ITERATIONS = 100000
+
+
+@pytest.mark.parametrize("work", ["attributes", "url_to", "enter_exit"])
+def test_context_proxy_overhead(lektor_pad, benchmark_report, work):
+    def attributes(ctx):
+        for _ in range(CTX_ITERATIONS):
+            _ = ctx.pad, ctx.source, ctx.cache, ctx.build_state
+
+    def url_to(ctx):
+        for _ in range(CTX_ITERATIONS // 10):
+            ctx.url_to("/projects")
+
+    def enter_exit(ctx):
+        for _ in range(CTX_ITERATIONS // 10):
+            with disable_dependency_recording():
+                pass
+
+    func = {"attributes": attributes, "url_to": url_to, "enter_exit": enter_exit}[work]
+
+    with lektor.context.Context(pad=lektor_pad) as ctx:
+        ctx.source = lektor_pad.get("/about")
+
+        def plain(_):
+            func(ctx)
+
+        def proxied(_):
+            with disable_dependency_recording():
+                func(lektor.context.get_ctx())
+
+        def forwarded(_):
+            with ForwardingContextProxy(ctx) as proxy:
+                func(proxy)
+
+        benchmark_report(
+            plain=best_time(plain),
+            proxied=best_time(proxied),
+            forwarded=best_time(forwarded),
+        )
@@ -2,8 +2,16 @@ import pytest
 from lektor.context import Context
 from lektor.context import get_ctx
 
+from lektorlib.context import batch_dependency_recording
+from lektorlib.context import collect_dependencies
+from lektorlib.context import DependencyCollectingContextProxy
+from lektorlib.context import DependencyFilteringContextProxy
 from lektorlib.context import DependencyIgnoringContextProxy
 from lektorlib.context import disable_dependency_recording
+from lektorlib.context import filter_dependency_recording
+from lektorlib.context import memoize_with_dependencies
+from lektorlib.context import record_dependencies
+from lektorlib.context import unique_dependencies
 
 
 class Test_disable_dependency_recording:
@@ -37,6 +45,19 @@ class TestDependencyIgnoringContextProxy:
         assert isinstance(proxy, DependencyIgnoringContextProxy)
         assert isinstance(proxy, Context)
 
+    def test_binds_attributes(self, proxy, lektor_context):
+        assert "pad" in vars(proxy)
+        assert proxy.pad is lektor_context.pad
+
+    def test_forwards_other_attributes(self, proxy, lektor_context):
+        lektor_context.late_attribute = "value"
+        assert proxy.late_attribute == "value"
+
+    def test_nested(self, proxy, lektor_context):
+        nested = DependencyIgnoringContextProxy(proxy)
+        assert nested.pad is lektor_context.pad
+        assert nested.cache is lektor_context.cache
+
     def test_cache(self, proxy, lektor_context):
         proxy.cache["test"] = "value"
         assert lektor_context.cache["test"] == "value"
@@ -55,3 +76,263 @@ class TestDependencyIgnoringContextProxy:
         assert not proxy.referenced_virtual_dependencies
         lektor_context.record_virtual_dependency(lektor_pad.get("/projects@2"))
         assert proxy.referenced_virtual_dependencies
+
+
+class Test_filter_dependency_recording:
+    @pytest.mark.usefixtures("lektor_context")
+    def test(self):
+        with filter_dependency_recording(r"\.lr$"):
+            get_ctx().record_dependency("a.lr")
+            get_ctx().record_dependency("b.ini")
+        get_ctx().record_dependency("c.ini")
+        assert get_ctx().referenced_dependencies == {"a.lr", "c.ini"}
+
+    def test_no_context(self):
+        assert get_ctx() is None
+        with filter_dependency_recording(r"\.lr$"):
+            assert get_ctx() is None
+        assert get_ctx() is None
+
+
+class TestDependencyFilteringContextProxy:
+    @pytest.fixture
+    def virtual_sources(self, lektor_pad):
+        return [lektor_pad.get("/projects@1"), lektor_pad.get("/projects@2")]
+
+    @pytest.fixture
+    def recorded(self, lektor_context):
+        recorded = []
+        with lektor_context.gather_dependencies(recorded.append):
+            yield recorded
+
+    def test_regex(self, lektor_context, virtual_sources, recorded):
+        proxy = DependencyFilteringContextProxy(lektor_context, r"^a|@1$")
+        proxy.record_dependency("a")
+        proxy.record_dependency("b")
+        for source in virtual_sources:
+            proxy.record_virtual_dependency(source)
+        assert recorded == ["a", virtual_sources[0]]
+
+    def test_predicate(self, lektor_context, virtual_sources, recorded):
+        def keep(dep):
+            return isinstance(dep, str)
+
+        proxy = DependencyFilteringContextProxy(lektor_context, keep)
+        proxy.record_dependency("a")
+        proxy.record_virtual_dependency(virtual_sources[0])
+        assert recorded == ["a"]
+
+    def test_affects_url(self, lektor_context, monkeypatch):
+        calls = []
+
+        def record_dependency(filename, **kwargs):
+            calls.append((filename, kwargs))
+
+        proxy = DependencyFilteringContextProxy(lektor_context, "a")
+        monkeypatch.setattr(lektor_context, "record_dependency", record_dependency)
+        proxy.record_dependency("a", affects_url=False)
+        proxy.record_dependency("a")
+        assert calls == [("a", {"affects_url": False}), ("a", {})]
+
+
+class Test_batch_dependency_recording:
+    def test(self, lektor_context):
+        recorded = []
+        with lektor_context.gather_dependencies(recorded.append):
+            with batch_dependency_recording():
+                for _ in range(3):
+                    get_ctx().record_dependency("a")
+                    get_ctx().record_dependency("b")
+                assert recorded == []
+        assert recorded == ["a", "b"]
+        assert get_ctx().referenced_dependencies == {"a", "b"}
+
+    def test_flushes_on_exception(self, lektor_context):
+        with pytest.raises(RuntimeError):
+            with batch_dependency_recording():
+                get_ctx().record_dependency("a")
+                raise RuntimeError()
+        assert lektor_context.referenced_dependencies == {"a"}
+
+    def test_no_context(self):
+        assert get_ctx() is None
+        with batch_dependency_recording():
+            assert get_ctx() is None
+        assert get_ctx() is None
+
+
+class Test_collect_dependencies:
+    def test(self, lektor_pad, lektor_context):
+        with collect_dependencies(lektor_pad) as dependencies:
+            get_ctx().record_dependency("a")
+            get_ctx().record_dependency("b")
+            get_ctx().record_dependency("a")
+        assert dependencies == ["a", "b"]
+        assert not lektor_context.referenced_dependencies
+
+    def test_sees_context_attributes(self, lektor_pad, lektor_context):
+        lektor_context.source = source = lektor_pad.get("/about")
+        with collect_dependencies(lektor_pad):
+            assert get_ctx().source is source
+            assert get_ctx().cache is lektor_context.cache
+
+    def test_recording_disabled(self, lektor_pad, lektor_context):
+        with disable_dependency_recording():
+            with collect_dependencies(lektor_pad) as dependencies:
+                get_ctx().record_dependency("a")
+        assert dependencies == ["a"]
+        assert not lektor_context.referenced_dependencies
+
+    def test_no_context(self, lektor_pad):
+        with collect_dependencies(lektor_pad) as dependencies:
+            assert get_ctx().pad is lektor_pad
+            get_ctx().record_dependency("a")
+        assert dependencies == ["a"]
+        assert get_ctx() is None
+
+
+class TestDependencyCollectingContextProxy:
+    @pytest.fixture
+    def virtual_sources(self, lektor_pad):
+        return [lektor_pad.get("/projects@1"), lektor_pad.get("/projects@2")]
+
+    @pytest.fixture
+    def recorded(self, lektor_context):
+        recorded = []
+        with lektor_context.gather_dependencies(recorded.append):
+            yield recorded
+
+    @pytest.fixture
+    def proxy(self, lektor_context):
+        return DependencyCollectingContextProxy(lektor_context)
+
+    def test_deduplicates(self, proxy, virtual_sources, recorded):
+        for _ in range(2):
+            proxy.record_dependency("a")
+            for source in virtual_sources:
+                proxy.record_virtual_dependency(source)
+        assert recorded == []
+        proxy.flush()
+        assert recorded == ["a", *virtual_sources]
+
+    def test_flush_clears(self, proxy, recorded):
+        proxy.record_dependency("a")
+        proxy.flush()
+        proxy.flush()
+        assert recorded == ["a"]
+
+    def test_own_collectors_called_immediately(self, proxy, virtual_sources, recorded):
+        gathered = []
+        with proxy.gather_dependencies(gathered.append):
+            proxy.record_dependency("a")
+            proxy.record_dependency("a")
+            proxy.record_virtual_dependency(virtual_sources[0])
+        assert gathered == ["a", "a", virtual_sources[0]]
+        assert recorded == []
+
+    def test_affects_url(self, proxy, lektor_context, monkeypatch):
+        calls = []
+
+        def record_dependency(filename, **kwargs):
+            calls.append((filename, kwargs))
+
+        monkeypatch.setattr(lektor_context, "record_dependency", record_dependency)
+        proxy.record_dependency("a", affects_url=False)
+        proxy.record_dependency("a")
+        proxy.flush()
+        assert calls == [("a", {"affects_url": False}), ("a", {})]
+
+
+class Test_memoize_with_dependencies:
+    @pytest.fixture
+    def func(self, virtual_source):
+        @memoize_with_dependencies
+        def func(arg, kwarg=None):
+            func.calls.append((arg, kwarg))
+            ctx = get_ctx()
+            if ctx is not None:
+                ctx.record_dependency(f"{arg}.lr")
+                ctx.record_dependency(f"{arg}.lr")
+                ctx.record_virtual_dependency(virtual_source)
+            return f"value-{arg}-{kwarg}"
+
+        func.calls = []
+        return func
+
+    @pytest.fixture
+    def virtual_source(self, lektor_pad):
+        return lektor_pad.get("/projects@1")
+
+    @staticmethod
+    def call_in_context(pad, func, *args, **kwargs):
+        recorded = []
+        with Context(pad=pad) as ctx:
+            with ctx.gather_dependencies(recorded.append):
+                value = func(*args, **kwargs)
+        return value, recorded
+
+    def test_replays_dependencies(self, func, lektor_pad, virtual_source):
+        first = self.call_in_context(lektor_pad, func, "a")
+        second = self.call_in_context(lektor_pad, func, "a")
+        assert first == ("value-a-None", ["a.lr", "a.lr", virtual_source])
+        assert second == ("value-a-None", ["a.lr", virtual_source])
+        assert func.calls == [("a", None)]
+
+    def test_arguments(self, func, lektor_pad):
+        self.call_in_context(lektor_pad, func, "a")
+        self.call_in_context(lektor_pad, func, "a", kwarg=1)
+        self.call_in_context(lektor_pad, func, "b")
+        self.call_in_context(lektor_pad, func, "a", kwarg=1)
+        assert func.calls == [("a", None), ("a", 1), ("b", None)]
+
+    def test_cached_per_pad(self, func, lektor_pad):
+        self.call_in_context(lektor_pad, func, "a")
+        self.call_in_context(lektor_pad.db.new_pad(), func, "a")
+        assert func.calls == [("a", None), ("a", None)]
+
+    def test_no_context(self, func):
+        assert func("a") == "value-a-None"
+        assert func("a") == "value-a-None"
+        assert func.calls == [("a", None), ("a", None)]
+
+    def test_not_cached_when_dependencies_ignored(self, func, lektor_context):
+        with disable_dependency_recording():
+            func("a")
+        func("a")
+        assert func.calls == [("a", None), ("a", None)]
+        assert "a.lr" in lektor_context.referenced_dependencies
+
+    def test_cached_when_dependencies_batched(self, func, lektor_context):
+        with batch_dependency_recording():
+            func("a")
+        func("a")
+        assert func.calls == [("a", None)]
+
+    def test_exceptions_not_cached(self, lektor_context):
+        @memoize_with_dependencies
+        def func():
+            func.calls += 1
+            raise RuntimeError()
+
+        func.calls = 0
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                func()
+        assert func.calls == 2
+
+
+class Test_record_dependencies:
+    def test(self, lektor_context, lektor_pad):
+        virtual_source = lektor_pad.get("/projects@1")
+        recorded = []
+        with lektor_context.gather_dependencies(recorded.append):
+            record_dependencies(["a", virtual_source])
+        assert recorded == ["a", virtual_source]
+
+    def test_no_context(self):
+        record_dependencies(["a"])
+
+
+def test_unique_dependencies(lektor_pad):
+    first, second = lektor_pad.get("/projects@1"), lektor_pad.get("/projects@1")
+    assert unique_dependencies(["a", first, "b", "a", second]) == ["a", first, "b"]
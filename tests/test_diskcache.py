@@ -0,0 +1,31 @@
+import pytest
+
+from lektorlib.diskcache import DiskCache
+
+
+class TestDiskCache:
+    @pytest.fixture
+    def source_cache(self, tmp_path):
+        disk_cache = DiskCache(tmp_path / "cache" / "cache.sqlite3")
+        yield disk_cache
+        disk_cache.close()
+
+    def test_recomputes_corrupt_entry(
+        self, source_cache, get_cached_virtual, new_record
+    ):
+        get_cached_virtual(new_record())
+        source_cache.db.execute("UPDATE virtual_sources SET state = x'00'")
+        assert get_cached_virtual(new_record(), data="new data").data == "new data"
+
+    def test_persists_on_disk(self, source_cache, get_cached_virtual, new_record):
+        get_cached_virtual(new_record())
+        source_cache.close()
+        source_cache.close()
+        get_cached_virtual(new_record())
+        assert get_cached_virtual.calls == ["vpath"]
+
+    def test_for_env(self, lektor_env, tmp_path, monkeypatch):
+        monkeypatch.setattr("lektorlib.diskcache.get_cache_dir", lambda: tmp_path)
+        disk_cache = DiskCache.for_env(lektor_env)
+        assert disk_cache.filename.startswith(str(tmp_path))
+        assert lektor_env.project.id in disk_cache.filename
@@ -0,0 +1,49 @@
+import os
+
+from lektorlib.fingerprint import fingerprint_files
+from lektorlib.fingerprint import iter_source_filenames
+
+
+class Test_fingerprint_files:
+    def test_stable(self, tmp_path):
+        filename = tmp_path / "file"
+        filename.write_text("data")
+        assert fingerprint_files([str(filename)]) == fingerprint_files([str(filename)])
+
+    def test_changes_with_mtime(self, tmp_path):
+        filename = tmp_path / "file"
+        filename.write_text("data")
+        fingerprint = fingerprint_files([str(filename)])
+        st = filename.stat()
+        os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert fingerprint_files([str(filename)]) != fingerprint
+
+    def test_changes_with_size(self, tmp_path):
+        filename = tmp_path / "file"
+        filename.write_text("data")
+        fingerprint = fingerprint_files([str(filename)])
+        st = filename.stat()
+        filename.write_text("more data")
+        os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert fingerprint_files([str(filename)]) != fingerprint
+
+    def test_missing_file(self, tmp_path):
+        filename = tmp_path / "file"
+        fingerprint = fingerprint_files([str(filename)])
+        assert fingerprint != fingerprint_files([])
+        filename.write_text("data")
+        assert fingerprint_files([str(filename)]) != fingerprint
+
+
+class Test_iter_source_filenames:
+    def test_record(self, lektor_pad, site_path):
+        filenames = list(iter_source_filenames(lektor_pad.get("/blog/post-a")))
+        assert filenames == [
+            str(site_path / "content/blog/post-a/contents.lr"),
+            str(site_path / "models/blog-post.ini"),
+        ]
+
+    def test_virtual_source(self, lektor_pad, site_path):
+        source = lektor_pad.get("/blog@1")
+        filenames = list(iter_source_filenames(source))
+        assert str(site_path / "content/blog/contents.lr") in filenames
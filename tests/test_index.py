@@ -0,0 +1,131 @@
+import pytest
+from jinja2 import Undefined
+from lektor.context import Context
+from lektor.db import F
+from lektor.environment import PRIMARY_ALT
+
+from lektorlib.index import FieldIndex
+from lektorlib.index import get_field_index
+from lektorlib.query import PrecomputedQuery
+
+
+@pytest.fixture
+def blog(lektor_pad):
+    return lektor_pad.get("/blog")
+
+
+class TestFieldIndex:
+    @pytest.fixture
+    def index(self, blog):
+        return FieldIndex(blog.children, "tags")
+
+    def test_values(self, index):
+        assert set(index) == {"python", "lektor", "performance"}
+        assert len(index) == 3
+        assert "python" in index
+        assert "java" not in index
+
+    def test_ids(self, index):
+        assert index.ids("python") == ["post-e", "post-a", "post-c"]
+        assert index.ids("java") == []
+
+    def test_query(self, index):
+        query = index.query("lektor")
+        assert isinstance(query, PrecomputedQuery)
+        assert [post.path for post in query] == ["/blog/post-b", "/blog/post-a"]
+
+    def test_query_matches_filter(self, blog):
+        index = FieldIndex(blog.children, "category")
+        expected = blog.children.filter(F.category == "misc")
+        assert list(index.query("misc")) == list(expected)
+
+    def test_query_missing_value(self, index):
+        assert not index.query("java")
+
+    def test_query_in(self, index):
+        query = index.query_in(["performance", "lektor"])
+        assert [post["_id"] for post in query] == [
+            "post-e",
+            "post-b",
+            "post-f",
+            "post-a",
+        ]
+
+    def test_with_alt(self, lektor_pad):
+        index = FieldIndex(lektor_pad.get("/blog", alt="xx").children, "category")
+        assert index.query("news").first().alt == "xx"
+
+    def test_skips_missing_field(self, lektor_pad):
+        index = FieldIndex(lektor_pad.query("/"), "category")
+        assert len(index) == 0
+
+    def test_skips_undefined_values(self, lektor_pad):
+        class DummyQuery(list):
+            path = "/"
+            alt = PRIMARY_ALT
+            pad = lektor_pad
+
+        query = DummyQuery(
+            [
+                {"_id": "a", "field": "value"},
+                {"_id": "b", "field": Undefined()},
+            ]
+        )
+        index = FieldIndex(query, "field")
+        assert index.ids("value") == ["a"]
+        assert len(index) == 1
+
+    def test_construction_does_not_record_dependencies(self, blog, lektor_context):
+        FieldIndex(blog.children, "tags")
+        assert not lektor_context.referenced_dependencies
+
+    @staticmethod
+    def gather_dependencies(pad, func):
+        with Context(pad=pad) as ctx:
+            func()
+        return ctx.referenced_dependencies
+
+    def test_query_records_dependencies_of_filter(self, blog, lektor_pad):
+        index = FieldIndex(blog.children, "tags")
+        filter_deps = self.gather_dependencies(
+            lektor_pad, lambda: list(blog.children.filter(F.tags.contains("lektor")))
+        )
+        index_deps = self.gather_dependencies(
+            lektor_pad, lambda: list(index.query("lektor"))
+        )
+        assert lektor_pad.db.to_fs_path("/blog") in filter_deps
+        assert filter_deps <= index_deps
+
+    @pytest.mark.parametrize(
+        "use_index",
+        [
+            lambda index: index.query("java"),
+            lambda index: index.query_in(["java"]),
+            lambda index: index.ids("java"),
+            lambda index: "java" in index,
+            lambda index: list(index),
+            len,
+        ],
+    )
+    def test_use_records_dependencies(self, blog, lektor_pad, use_index):
+        index = FieldIndex(blog.children, "tags")
+        deps = self.gather_dependencies(lektor_pad, lambda: use_index(index))
+        assert lektor_pad.db.to_fs_path("/blog") in deps
+        assert lektor_pad.db.to_fs_path("/blog/post-f/contents.lr") in deps
+
+
+class Test_get_field_index:
+    def test(self, blog):
+        index = get_field_index(blog, "tags")
+        assert isinstance(index, FieldIndex)
+        assert index.field == "tags"
+        assert index.path == "/blog"
+
+    def test_cached(self, blog):
+        assert get_field_index(blog, "tags") is get_field_index(blog, "tags")
+        assert get_field_index(blog, "tags") is not get_field_index(blog, "category")
+
+    def test_cached_per_pad(self, blog, lektor_pad):
+        other_pad = lektor_pad.db.new_pad()
+        other_blog = other_pad.get("/blog")
+        assert get_field_index(blog, "tags") is not get_field_index(other_blog, "tags")
@@ -1,14 +1,26 @@
+import gc
 import inspect
+import os
 import re
 
+import lektor.db
 import pytest
+from lektor.context import Context
+from lektor.context import get_ctx
+from lektor.db import F
 from lektor.environment import Expression
 from lektor.environment import PRIMARY_ALT
 from lektor.pluginsystem import Plugin
 from lektor.sourceobj import VirtualSourceObject
 
+import lektorlib.query
+from lektorlib.context import disable_dependency_recording
 from lektorlib.query import get_source
+from lektorlib.query import get_sources
 from lektorlib.query import PrecomputedQuery
+from lektorlib.testing import assert_no_dependencies
+from lektorlib.testing import generate_site
+from lektorlib.testing import make_env
 
 
 class DummyVirtualSource(VirtualSourceObject):
@@ -144,6 +156,109 @@ class Test_get_source:
         assert get_source(lektor_pad, path, page_num=1) is None
 
 
+@pytest.mark.usefixtures("dummy_plugin")
+class Test_get_source_caching:
+    @pytest.fixture
+    def for_page_calls(self, monkeypatch):
+        calls = []
+        for_page = DummyPaginationController.for_page
+
+        def counting_for_page(self, page_num):
+            calls.append(page_num)
+            return for_page(self, page_num)
+
+        monkeypatch.setattr(DummyPaginationController, "for_page", counting_for_page)
+        return calls
+
+    def test_paginated_source_cached(self, lektor_pad, for_page_calls):
+        path = "/projects@paginated-virtual/foo"
+        source = get_source(lektor_pad, path, page_num=2)
+        assert source.page_num == 2
+        assert get_source(lektor_pad, path, page_num=2) is source
+        assert for_page_calls == [2]
+        assert get_source(lektor_pad, path, page_num=3).page_num == 3
+        assert get_source(lektor_pad, path).page_num is None
+
+    @pytest.mark.parametrize("persist", [True, False])
+    def test_persist(self, lektor_pad, persist):
+        source = get_source(
+            lektor_pad, "/@paginated-virtual", page_num=2, persist=persist
+        )
+        if persist:
+            assert source in lektor_pad.cache.persistent.values()
+        else:
+            assert source in lektor_pad.cache.ephemeral.values()
+
+    def test_records_dependency_when_cached(self, lektor_pad, lektor_context):
+        path = "/projects@paginated-virtual/foo"
+        get_source(lektor_pad, path, page_num=2)
+        lektor_context.referenced_dependencies.clear()
+        lektor_context.referenced_virtual_dependencies.clear()
+        source = get_source(lektor_pad, path, page_num=2)
+        assert lektor_context.referenced_dependencies
+        assert source.path in {
+            getattr(vdep, "path", vdep)
+            for vdep in lektor_context.referenced_virtual_dependencies
+        }
+
+    def test_unsupported_pagination_remembered(self, lektor_pad, monkeypatch):
+        assert get_source(lektor_pad, "/@dummy-virtual", page_num=1) is None
+        monkeypatch.setattr(DummyVirtualSource, "pagination", None, raising=False)
+        assert get_source(lektor_pad, "/@dummy-virtual", page_num=1) is None
+
+
+@pytest.mark.usefixtures("dummy_plugin")
+class Test_get_sources:
+    PATHS = [
+        "/",
+        "/about",
+        "/missing",
+        "/about@dummy-virtual",
+        "/projects@dummy-virtual/foo",
+        "/projects@dummy-virtual/missing",
+        "/missing@dummy-virtual",
+        "/projects@paginated-virtual",
+        "/@paginated-virtual/foo",
+        "/@dummy-virtual@dummy-virtual",
+    ]
+
+    @pytest.mark.parametrize("page_num", [None, 1])
+    def test_matches_get_source(self, lektor_pad, page_num):
+        sources = get_sources(lektor_pad, self.PATHS, page_num=page_num)
+        expected = [
+            get_source(lektor_pad, path, page_num=page_num) for path in self.PATHS
+        ]
+        assert [getattr(src, "path", None) for src in sources] == [
+            getattr(src, "path", None) for src in expected
+        ]
+
+    def test_cached_record(self, lektor_pad, lektor_context):
+        record = lektor_pad.get("/about")
+        lektor_context.referenced_dependencies.clear()
+        assert get_sources(lektor_pad, ["/about"]) == [record]
+        assert record.source_filename in lektor_context.referenced_dependencies
+
+    def test_cached_virtual_source(self, lektor_pad):
+        record = lektor_pad.get("/projects")
+        source = DummyVirtualSource(record, extra_path="cached")
+        lektor_pad.cache.remember(source)
+        paths = ["/projects@dummy-virtual/cached", "/projects@dummy-virtual/x"]
+        assert get_sources(lektor_pad, paths)[0] is source
+
+    def test_resolves_parent_once(self, lektor_pad, monkeypatch):
+        calls = []
+        pad_get = lektor_pad.get
+
+        def get(path, *args, **kwargs):
+            calls.append(path)
+            return pad_get(path, *args, **kwargs)
+
+        monkeypatch.setattr(lektor_pad, "get", get)
+        paths = [f"/projects@dummy-virtual/{id}" for id in "abc"]
+        assert [src.path for src in get_sources(lektor_pad, paths)] == paths
+        assert calls.count("/projects") == 1
+
+
 @pytest.mark.usefixtures("dummy_plugin")
 class QueryTestBase:
     @pytest.fixture
@@ -199,6 +314,23 @@ class QueryTestBase:
     def test__get_bad_id(self, query):
         assert query._get("missing", persist=False) is None
 
+    def test__get_batch(self, query, child_ids):
+        records = query._get_batch(child_ids)
+        assert [record.path.rpartition("/")[2] for record in records] == list(child_ids)
+
+    def test_first_loads_only_first_child(self, query, monkeypatch):
+        loaded = []
+        iter_batch = query._iter_batch
+
+        def _iter_batch(ids, **kwargs):
+            for record in iter_batch(ids, **kwargs):
+                loaded.append(record)
+                yield record
+
+        monkeypatch.setattr(query, "_iter_batch", _iter_batch)
+        assert query.first() is not None
+        assert len(loaded) == 1
+
     def test_count(self, query, lektor_context):
         # .count() on a pristine PrecomputedQuery should not register deps
         n = query.count()
@@ -287,3 +419,600 @@ class TestPaginatedVirtualSourceQuery(TestVirtualSourceQuery):
             "/projects@paginated-virtual/a/page=1",
             "/projects@paginated-virtual/b/page=1",
         ]
+
+
+@pytest.mark.usefixtures("dummy_plugin")
+class TestUnpaginatedChildren:
+    @pytest.fixture
+    def make_query(self, lektor_pad):
+        def make_query(child_ids):
+            path = f"/projects@{DummyVirtualSource.virtual_path_prefix}"
+            return PrecomputedQuery(path, lektor_pad, child_ids).request_page(1)
+
+        return make_query
+
+    @pytest.fixture
+    def get_source_calls(self, monkeypatch):
+        calls = []
+        get_source = lektorlib.query.get_source
+
+        def counting_get_source(pad, path, **kwargs):
+            calls.append((path, kwargs.get("page_num")))
+            return get_source(pad, path, **kwargs)
+
+        monkeypatch.setattr(lektorlib.query, "get_source", counting_get_source)
+        return calls
+
+    def test_unpaginated_remembered(self, make_query, get_source_calls):
+        assert list(make_query(["a", "b"])) == []
+        assert ("/projects@dummy-virtual/a", None) in get_source_calls
+        get_source_calls.clear()
+        assert list(make_query(["a", "b"])) == []
+        assert get_source_calls == []
+
+    def test_unpaginated_records_dependencies(
+        self, make_query, lektor_pad, monkeypatch
+    ):
+        init = DummyVirtualSource.__init__
+
+        def recording_init(self, record, extra_path=None):
+            init(self, record, extra_path)
+            get_ctx().record_dependency(f"{extra_path}.dep")
+
+        monkeypatch.setattr(DummyVirtualSource, "__init__", recording_init)
+
+        def iterate():
+            deps = []
+            with Context(pad=lektor_pad) as ctx:
+                with ctx.gather_dependencies(deps.append):
+                    assert list(make_query(["a"])) == []
+            return deps
+
+        assert "a.dep" in iterate()
+        assert "a.dep" in iterate()
+
+    def test_remembered_per_page(self, lektor_pad, monkeypatch):
+        def for_page(self, page_num):
+            # a source with only a single page
+            if page_num == 1:
+                return PaginatedVirtualSource(self.source.record, "a", page_num)
+            return None
+
+        monkeypatch.setattr(DummyPaginationController, "for_page", for_page)
+        path = f"/projects@{PaginatedVirtualSource.virtual_path_prefix}"
+        query = PrecomputedQuery(path, lektor_pad, ["a"])
+        assert list(query.request_page(2)) == []
+        assert [source.page_num for source in query.request_page(1)] == [1]
+
+    def test_missing_remembered(self, make_query, get_source_calls):
+        with pytest.raises(RuntimeError):
+            list(make_query(["a", "missing"]))
+        get_source_calls.clear()
+        with pytest.raises(RuntimeError, match="missing"):
+            list(make_query(["a", "missing"]))
+        assert ("/projects@dummy-virtual/missing", None) not in get_source_calls
+
+
+class TestBlogPostQuery(QueryTestBase):
+    @pytest.fixture
+    def query_path(self):
+        return "/blog"
+
+    @pytest.fixture
+    def child_ids(self):
+        return [f"post-{c}" for c in "abcdef"]
+
+    def test_order_by(self, query):
+        ordered = query.order_by("-pub_date")
+        assert [post["_id"] for post in ordered] == [
+            "post-e",
+            "post-b",
+            "post-f",
+            "post-d",
+            "post-a",
+            "post-c",
+        ]
+
+    @pytest.mark.parametrize("order_by", [("-pub_date",), ("category", "-title")])
+    @pytest.mark.parametrize(
+        "offset, limit",
+        [
+            (None, 1),
+            (None, 3),
+            (2, 2),
+            (4, 10),
+            (10, 2),
+            (3, None),
+            (None, 0),
+        ],
+    )
+    def test_order_by_sliced(self, query, order_by, offset, limit):
+        ordered = [post["_id"] for post in query.order_by(*order_by)]
+        start = offset or 0
+        stop = start + limit if limit else None
+
+        sliced = query.order_by(*order_by)
+        if offset is not None:
+            sliced = sliced.offset(offset)
+        if limit is not None:
+            sliced = sliced.limit(limit)
+        assert [post["_id"] for post in sliced] == ordered[start:stop]
+
+    def test_order_by_limit_does_not_sort_all(self, query, monkeypatch):
+        monkeypatch.setattr(lektorlib.query, "sorted", None, raising=False)
+        latest = query.order_by("-pub_date").limit(2)
+        assert [post["_id"] for post in latest] == ["post-e", "post-b"]
+
+    @pytest.mark.parametrize(
+        "offset, limit, expected",
+        [
+            (2, 2, ["post-c", "post-d"]),
+            (4, None, ["post-e", "post-f"]),
+            (None, 1, ["post-a"]),
+            (5, 10, ["post-f"]),
+            (10, None, []),
+        ],
+    )
+    def test_offset_limit(self, query, offset, limit, expected):
+        if offset is not None:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        assert [post["_id"] for post in query] == expected
+        assert query.count() == len(expected)
+        assert bool(query) is bool(expected)
+
+    @pytest.fixture
+    def post_deps(self, lektor_pad, lektor_context):
+        def post_deps():
+            deps = lektor_context.referenced_dependencies
+            return {dep for dep in deps if "post-" in dep}
+
+        def expected(*ids):
+            to_fs_path = lektor_pad.db.to_fs_path
+            return {to_fs_path(f"/blog/{id}/contents.lr") for id in ids}
+
+        post_deps.expected = expected
+        return post_deps
+
+    def test_offset_limit_loads_only_page(self, query, post_deps):
+        paged = query.offset(2).limit(2)
+        assert [post["_id"] for post in paged] == ["post-c", "post-d"]
+        assert post_deps() == post_deps.expected("post-c", "post-d")
+
+    @pytest.mark.parametrize(
+        "child_ids", [["post-a", "post-g", "post-b", "post-c", "post-d"]]
+    )
+    def test_offset_limit_including_undiscoverable(self, query, post_deps):
+        paged = query.include_undiscoverable(True).include_hidden(True)
+        paged = paged.offset(1).limit(2)
+        assert [post["_id"] for post in paged] == ["post-g", "post-b"]
+        assert paged.count() == 2
+        assert post_deps() == post_deps.expected("post-g", "post-b")
+
+    @pytest.mark.parametrize(
+        "offset, limit, expected",
+        [
+            (None, 2, ["post-a", "post-b"]),
+            (1, 2, ["post-b", "post-c"]),
+            (None, 5, ["post-a", "post-b", "post-c", "post-d"]),
+            (3, None, ["post-d"]),
+        ],
+    )
+    @pytest.mark.parametrize(
+        "child_ids", [["post-a", "post-g", "post-b", "post-c", "post-d"]]
+    )
+    def test_filtered_offset_limit_skips_undiscoverable(
+        self, query, offset, limit, expected
+    ):
+        query = query.filter(F._id.startswith("post-"))
+        if offset is not None:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        assert [post["_id"] for post in query] == expected
+        assert query.count() == len(expected)
+        assert bool(query) is bool(expected)
+
+    @pytest.mark.parametrize(
+        "make_results, expected",
+        [
+            (lambda query: query, {"post-a"}),
+            (
+                lambda query: query.filter(F.category == "misc"),
+                {"post-a", "post-b", "post-c"},
+            ),
+        ],
+    )
+    def test_first_records_only_seen_children(
+        self, query, lektor_pad, lektor_context, make_results, expected
+    ):
+        assert make_results(query).first() is not None
+        deps = lektor_context.referenced_dependencies
+        assert {dep for dep in deps if "post-" in dep} == {
+            lektor_pad.db.to_fs_path(f"/blog/{id}/contents.lr") for id in expected
+        }
+
+    def test_break_records_only_seen_children(self, query, lektor_pad, lektor_context):
+        for post in query:
+            if post["_id"] == "post-c":
+                break
+        deps = lektor_context.referenced_dependencies
+        assert {dep for dep in deps if "post-" in dep} == {
+            lektor_pad.db.to_fs_path(f"/blog/{id}/contents.lr")
+            for id in ("post-a", "post-b", "post-c")
+        }
+
+
+class TestPrecomputedQueryValues:
+    @pytest.fixture
+    def query(self, lektor_pad):
+        return PrecomputedQuery("/blog", lektor_pad, [f"post-{c}" for c in "abcdef"])
+
+    @pytest.fixture
+    def batches(self, monkeypatch):
+        batches = []
+        iter_batch = PrecomputedQuery._iter_batch
+
+        def _iter_batch(self, ids, **kwargs):
+            batches.append(ids)
+            return iter_batch(self, ids, **kwargs)
+
+        monkeypatch.setattr(PrecomputedQuery, "_iter_batch", _iter_batch)
+        return batches
+
+    @staticmethod
+    def gather_dependencies(pad, func):
+        deps = []
+        with Context(pad=pad) as ctx:
+            with ctx.gather_dependencies(deps.append):
+                rv = func()
+        return rv, set(deps)
+
+    def test_values(self, query):
+        assert query.values("_id", "category")[:2] == [
+            ("post-a", "news"),
+            ("post-b", "news"),
+        ]
+
+    def test_pluck(self, query):
+        assert query.order_by("-pub_date").limit(3).pluck("_id") == [
+            "post-e",
+            "post-b",
+            "post-f",
+        ]
+
+    def test_filtered(self, query):
+        assert query.filter(F.category == "misc").pluck("_id") == [
+            "post-c",
+            "post-d",
+            "post-f",
+        ]
+
+    def test_cached(self, query, batches):
+        first = query.pluck("title")
+        assert batches
+        del batches[:]
+        assert query.pluck("title") == first
+        assert batches == []
+
+    def test_cache_keys(self, query):
+        assert query.pluck("_id") != query.order_by("-title").pluck("_id")
+        assert query.pluck("_id") != query.offset(1).pluck("_id")
+        assert query.pluck("_id") != query.pluck("title")
+
+    def test_filtered_not_cached(self, query, batches):
+        query = query.filter(F.category == "misc")
+        query.pluck("_id")
+        del batches[:]
+        query.pluck("_id")
+        assert batches
+
+    def test_replays_dependencies(self, query, lektor_pad):
+        first, deps = self.gather_dependencies(lektor_pad, lambda: query.pluck("_id"))
+        second, cached_deps = self.gather_dependencies(
+            lektor_pad, lambda: query.pluck("_id")
+        )
+        assert first == second
+        assert any("post-a" in dep for dep in deps)
+        assert cached_deps == deps
+
+    def test_dependencies_gathered_while_disabled(self, query, lektor_pad):
+        with Context(pad=lektor_pad):
+            with disable_dependency_recording():
+                query.pluck("title")
+        _, cached_deps = self.gather_dependencies(
+            lektor_pad, lambda: query.pluck("title")
+        )
+        for c in "abcdef":
+            assert any(f"post-{c}" in dep for dep in cached_deps)
+
+    def test_sees_current_context(self, query, lektor_pad, monkeypatch):
+        sources = []
+        iter_batch = query._iter_batch
+
+        def _iter_batch(ids, **kwargs):
+            sources.append(get_ctx().source)
+            return iter_batch(ids, **kwargs)
+
+        monkeypatch.setattr(query, "_iter_batch", _iter_batch)
+        with Context(pad=lektor_pad) as ctx:
+            ctx.source = lektor_pad.get("/about")
+            query.pluck("_id")
+        assert sources == [ctx.source]
+
+    def test_requires_fields(self, query):
+        with pytest.raises(TypeError):
+            query.values()
+
+
+class TestPrecomputedQueryFingerprint:
+    @pytest.fixture
+    def site(self, tmp_path):
+        return generate_site(tmp_path, pages=4)
+
+    @pytest.fixture
+    def pad(self, site):
+        return lektor.db.Database(make_env(site)).new_pad()
+
+    @pytest.fixture
+    def child_ids(self):
+        return [f"post-{n:05d}" for n in range(3)]
+
+    @pytest.fixture
+    def touch(self, site):
+        def touch(path):
+            filename = site / "content" / path
+            st = filename.stat()
+            os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+        return touch
+
+    def test_stable(self, pad, child_ids):
+        query = PrecomputedQuery("/blog", pad, child_ids)
+        assert query.fingerprint() == query.fingerprint()
+        assert query.filter(F.title).fingerprint() == query.fingerprint()
+
+    def test_depends_on_child_ids(self, pad, child_ids):
+        fingerprint = PrecomputedQuery("/blog", pad, child_ids).fingerprint()
+        reordered = PrecomputedQuery("/blog", pad, child_ids[::-1])
+        assert reordered.fingerprint() != fingerprint
+        fewer = PrecomputedQuery("/blog", pad, child_ids[:-1])
+        assert fewer.fingerprint() != fingerprint
+
+    @pytest.mark.parametrize(
+        "path, changed",
+        [
+            ("blog/post-00001/contents.lr", True),
+            ("blog/contents.lr", True),
+            ("blog/post-00003/contents.lr", False),
+        ],
+    )
+    def test_depends_on_source_files(self, pad, child_ids, touch, path, changed):
+        query = PrecomputedQuery("/blog", pad, child_ids)
+        fingerprint = query.fingerprint()
+        touch(path)
+        assert (query.fingerprint() != fingerprint) is changed
+
+    def test_alt(self, pad, site, child_ids):
+        query = PrecomputedQuery("/blog", pad, child_ids, alt="de")
+        fingerprint = query.fingerprint()
+        assert PrecomputedQuery("/blog", pad, child_ids).fingerprint() != fingerprint
+        (site / "content/blog/post-00000/contents+de.lr").write_text("title: De\n")
+        assert query.fingerprint() != fingerprint
+
+    def test_virtual_children(self, pad, touch, child_ids):
+        query = PrecomputedQuery("/blog@tags", pad, child_ids)
+        fingerprint = query.fingerprint()
+        touch("blog/post-00000/contents.lr")
+        assert query.fingerprint() == fingerprint
+        touch("blog/contents.lr")
+        assert query.fingerprint() != fingerprint
+
+    def test_missing_parent(self, pad, child_ids):
+        query = PrecomputedQuery("/missing", pad, child_ids)
+        assert (
+            query.fingerprint() != PrecomputedQuery("/", pad, child_ids).fingerprint()
+        )
+
+    def test_loads_no_children(self, pad, child_ids):
+        query = PrecomputedQuery("/blog", pad, child_ids)
+        with Context(pad=pad) as ctx, assert_no_dependencies():
+            query.fingerprint()
+        assert ctx.referenced_dependencies == set()
+        assert pad.cache.get(f"/blog/{child_ids[0]}", PRIMARY_ALT, None) is Ellipsis
+
+
+class TestPrecomputedQuerySetOperations:
+    @pytest.fixture
+    def make_query(self, lektor_pad):
+        def make_query(ids, path="/blog", alt=PRIMARY_ALT, pad=lektor_pad):
+            return PrecomputedQuery(path, pad, [f"post-{c}" for c in ids], alt=alt)
+
+        return make_query
+
+    @staticmethod
+    def ids(query):
+        return "".join(id[-1] for id in query._PrecomputedQuery__child_ids)
+
+    def test_union(self, make_query):
+        assert self.ids(make_query("cab") | make_query("dbe")) == "cabde"
+        assert self.ids(make_query("c").union(make_query("a"), make_query("ca"))) == (
+            "ca"
+        )
+
+    def test_intersection(self, make_query):
+        assert self.ids(make_query("cabd") & make_query("dbe")) == "bd"
+        assert (
+            self.ids(make_query("abc").intersection(make_query("bc"), make_query("c")))
+            == "c"
+        )
+
+    def test_difference(self, make_query):
+        assert self.ids(make_query("cabd") - make_query("dbe")) == "ca"
+        assert (
+            self.ids(make_query("abcd").difference(make_query("b"), make_query("c")))
+            == "ad"
+        )
+
+    def test_result_is_pristine(self, make_query, lektor_context):
+        query = make_query("abc") & make_query("bcd")
+        assert query._pristine
+        assert query.count() == 2
+        assert query
+        assert not (make_query("a") & make_query("b"))
+        assert not lektor_context.referenced_dependencies
+        assert [post["_id"] for post in query] == ["post-b", "post-c"]
+
+    def test_result_preserves_class_and_settings(self, lektor_pad):
+        class CustomQuery(PrecomputedQuery):
+            pass
+
+        query = CustomQuery("/blog", lektor_pad, ["post-a", "post-b"])
+        query.setting = "value"
+        result = query - CustomQuery("/blog", lektor_pad, ["post-b"])
+        assert type(result) is CustomQuery
+        assert result.setting == "value"
+        assert self.ids(result) == "a"
+        assert self.ids(query) == "ab"
+
+    def test_no_operands(self, make_query):
+        assert self.ids(make_query("ab").intersection()) == "ab"
+
+    @pytest.mark.parametrize(
+        "other_kw",
+        [
+            {"path": "/projects"},
+            {"alt": "xx"},
+        ],
+    )
+    def test_mismatched_queries(self, make_query, other_kw):
+        with pytest.raises(ValueError, match="same path"):
+            make_query("ab") | make_query("bc", **other_kw)
+
+    def test_mismatched_pads(self, make_query, lektor_pad):
+        other_pad = lektor_pad.db.new_pad()
+        with pytest.raises(ValueError, match="same path"):
+            make_query("ab") | make_query("bc", pad=other_pad)
+
+    @pytest.mark.parametrize("filtered", ["self", "other"])
+    def test_requires_pristine_queries(self, make_query, filtered):
+        query, other = make_query("ab"), make_query("bc")
+        if filtered == "self":
+            query = query.filter(F.category == "news")
+        else:
+            other = other.order_by("title")
+        with pytest.raises(ValueError, match="pristine"):
+            query - other
+
+    @pytest.mark.parametrize("op", ["__or__", "__and__", "__sub__"])
+    def test_not_implemented(self, make_query, op):
+        assert getattr(make_query("a"), op)({"post-a"}) is NotImplemented
+
+
+class TestBlogPostQuerySortMemoization:
+    @pytest.fixture
+    def query(self, lektor_pad):
+        return PrecomputedQuery("/blog", lektor_pad, [f"post-{c}" for c in "abcdef"])
+
+    @pytest.fixture
+    def sort_key_calls(self, monkeypatch):
+        calls = []
+        get_sort_key = lektor.db.Record.get_sort_key
+
+        def counting_get_sort_key(record, fields):
+            calls.append(record.path)
+            return get_sort_key(record, fields)
+
+        monkeypatch.setattr(lektor.db.Record, "get_sort_key", counting_get_sort_key)
+        return calls
+
+    @pytest.fixture
+    def iterate_calls(self, monkeypatch):
+        calls = []
+        _iterate = PrecomputedQuery._iterate
+
+        def counting_iterate(query, *args):
+            calls.append(args)
+            return _iterate(query, *args)
+
+        monkeypatch.setattr(PrecomputedQuery, "_iterate", counting_iterate)
+        return calls
+
+    @staticmethod
+    def ids(query):
+        return [post["_id"] for post in query]
+
+    def test_sort_keys_memoized(self, query, sort_key_calls):
+        expected = ["post-e", "post-b", "post-f", "post-d", "post-a", "post-c"]
+        assert self.ids(query.order_by("-pub_date")) == expected
+        assert len(sort_key_calls) == 6
+        subset = PrecomputedQuery("/blog", query.pad, ["post-a", "post-b"])
+        assert self.ids(subset.order_by("-pub_date")) == ["post-b", "post-a"]
+        assert len(sort_key_calls) == 6
+
+    def test_sort_keys_per_order_by(self, query, sort_key_calls):
+        list(query.order_by("-pub_date"))
+        list(query.order_by("title"))
+        assert len(sort_key_calls) == 12
+
+    def test_sort_keys_survive_record_cache_flush(self, query, sort_key_calls):
+        list(query.order_by("-pub_date"))
+        query.pad.cache.flush()
+        gc.collect()
+        list(query.order_by("-pub_date").limit(2))
+        assert len(sort_key_calls) == 6
+
+    def test_order_reused_by_clones(self, query, iterate_calls, lektor_context):
+        ordered = query.order_by("-pub_date")
+        assert self.ids(ordered) == self.ids(query.order_by("-pub_date"))
+        assert iterate_calls.count(()) == 1
+
+        lektor_context.referenced_dependencies.clear()
+        assert self.ids(ordered.offset(1).limit(2)) == ["post-b", "post-f"]
+        assert iterate_calls.count(()) == 1
+        assert iterate_calls[-1] == (["post-b", "post-f"],)
+        # the order depends on all posts
+        post_deps = {
+            dep for dep in lektor_context.referenced_dependencies if "post-" in dep
+        }
+        assert len(post_deps) == 6
+
+    def test_order_survives_record_cache_flush(self, query, iterate_calls):
+        ordered = query.order_by("-pub_date")
+        expected = self.ids(ordered)
+        query.pad.cache.flush()
+        gc.collect()
+        assert self.ids(ordered) == expected
+        assert iterate_calls.count(()) == 1
+
+    def test_order_skips_unmatched_children(self, lektor_pad, iterate_calls):
+        query = PrecomputedQuery("/blog", lektor_pad, ["post-a", "post-g", "post-b"])
+        assert self.ids(query.order_by("title")) == ["post-a", "post-b"]
+        assert self.ids(query.order_by("title")) == ["post-a", "post-b"]
+        assert iterate_calls.count(()) == 1
+
+    def test_order_memoized_for_large_queries(
+        self, tmp_path, sort_key_calls, iterate_calls
+    ):
+        # More children than fit in the pad's ephemeral record cache
+        pages = 1200
+        pad = lektor.db.Database(make_env(generate_site(tmp_path, pages))).new_pad()
+        child_ids = [f"post-{n:05d}" for n in range(pages)]
+        query = PrecomputedQuery("/blog", pad, child_ids).order_by("-title")
+        expected = self.ids(query)
+        assert sorted(expected) == child_ids
+        assert len(sort_key_calls) == pages
+        deps = []
+        with Context(pad=pad) as ctx:
+            with ctx.gather_dependencies(deps.append):
+                assert self.ids(query.limit(3)) == expected[:3]
+        assert len(sort_key_calls) == pages
+        assert iterate_calls.count(()) == 1
+        assert pad.db.to_fs_path(f"/blog/{child_ids[0]}/contents.lr") in deps
+
+    def test_order_not_memoized_for_filtered_queries(self, query, iterate_calls):
+        filtered = query.filter(F.category == "news").order_by("-pub_date")
+        assert self.ids(filtered) == ["post-e", "post-b", "post-a"]
+        assert self.ids(filtered) == ["post-e", "post-b", "post-a"]
+        assert len(iterate_calls) == 2
@@ -1,7 +1,24 @@
+import gc
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+
+import lektor.db
 import pytest
 from lektor.sourceobj import VirtualSourceObject
 
+from lektorlib import recordcache
+from lektorlib.recordcache import CacheStats
+from lektorlib.recordcache import disable_cache_stats
+from lektorlib.recordcache import enable_cache_stats
+from lektorlib.recordcache import get_cache_stats
 from lektorlib.recordcache import get_or_create_virtual
+from lektorlib.recordcache import get_or_create_virtuals
+from lektorlib.recordcache import get_pad_cache
+from lektorlib.recordcache import PrefixCacheStats
+from lektorlib.recordcache import set_persist_limit
 
 
 class Test_get_or_create_virtual:
@@ -45,6 +62,19 @@ class Test_get_or_create_virtual:
         else:
             assert virtual_source in lektor_pad.cache.ephemeral.values()
 
+    @pytest.mark.parametrize("persist", [True, False])
+    def test_caches_under_virtual_path(self, record, virtual_source, persist):
+        def creator():
+            creator.calls.append(())
+            return virtual_source
+
+        creator.calls = []
+
+        for _n in range(2):
+            rv = get_or_create_virtual(record, "other/path", creator, persist)
+            assert rv is virtual_source
+        assert creator.calls == [()]
+
     def test_remembers_missing(self, record):
         def creator():
             creator.calls.append(())
@@ -66,3 +96,417 @@ class DummyVirtualSource(VirtualSourceObject):
     @property
     def path(self):
         return f"{self.record.path}@{self._virtual_path}"
+
+
+class Test_get_pad_cache:
+    def test_same_cache(self, lektor_pad):
+        cache = get_pad_cache(lektor_pad, "test")
+        cache["key"] = "value"
+        assert get_pad_cache(lektor_pad, "test") == {"key": "value"}
+
+    def test_namespaces_are_distinct(self, lektor_pad):
+        get_pad_cache(lektor_pad, "test")["key"] = "value"
+        assert get_pad_cache(lektor_pad, "other") == {}
+
+    def test_pads_are_distinct(self, lektor_pad):
+        get_pad_cache(lektor_pad, "test")["key"] = "value"
+        other_pad = lektor_pad.db.new_pad()
+        assert get_pad_cache(other_pad, "test") == {}
+
+    def test_does_not_keep_pad_alive(self, lektor_env):
+        pad = lektor.db.Database(lektor_env).new_pad()
+        get_pad_cache(pad, "test")["pad"] = pad
+        pad_ref = weakref.ref(pad)
+        del pad
+        gc.collect()
+        assert pad_ref() is None
+
+
+class Test_get_or_create_virtuals:
+    @pytest.fixture
+    def record(self, lektor_pad):
+        return lektor_pad.get("/about")
+
+    @pytest.fixture
+    def creator(self, record):
+        def creator(virtual_paths):
+            creator.calls.append(list(virtual_paths))
+            return {
+                vpath: DummyVirtualSource(record, vpath)
+                for vpath in virtual_paths
+                if "missing" not in vpath
+            }
+
+        creator.calls = []
+        return creator
+
+    def test_creates_in_one_call(self, record, creator):
+        rv = get_or_create_virtuals(record, ["a", "missing", "b"], creator)
+        assert [getattr(src, "path", None) for src in rv] == [
+            "/about@a",
+            None,
+            "/about@b",
+        ]
+        assert creator.calls == [["a", "missing", "b"]]
+
+    def test_caches(self, record, creator):
+        first = get_or_create_virtuals(record, ["a", "missing"], creator)
+        second = get_or_create_virtuals(record, ["missing", "b", "a"], creator)
+        assert second == [None, second[1], first[0]]
+        assert second[1].path == "/about@b"
+        assert creator.calls == [["a", "missing"], ["b"]]
+
+    def test_no_misses(self, record, creator):
+        get_or_create_virtuals(record, ["a"], creator)
+        get_or_create_virtuals(record, ["a"], creator)
+        assert creator.calls == [["a"]]
+
+    def test_duplicates(self, record, creator):
+        rv = get_or_create_virtuals(record, iter(["a", "a"]), creator)
+        assert rv[0] is rv[1]
+        assert creator.calls == [["a"]]
+
+    def test_finds_sources_cached_by_get_or_create_virtual(self, record, creator):
+        source = get_or_create_virtual(record, "a", lambda: creator(["a"])["a"])
+        assert get_or_create_virtuals(record, ["a"], creator) == [source]
+
+    @pytest.mark.parametrize("persist", [True, False])
+    def test_persist(self, record, creator, persist, lektor_pad):
+        (source,) = get_or_create_virtuals(record, ["a"], creator, persist=persist)
+        if persist:
+            assert source in lektor_pad.cache.persistent.values()
+        else:
+            assert source in lektor_pad.cache.ephemeral.values()
+
+
+class TestCacheStats:
+    @pytest.fixture
+    def record(self, lektor_pad):
+        return lektor_pad.get("/about")
+
+    @pytest.fixture
+    def stats(self):
+        stats = enable_cache_stats(timing=True)
+        try:
+            yield stats
+        finally:
+            disable_cache_stats()
+
+    def test_enable_disable(self, stats):
+        assert get_cache_stats() is stats
+        disable_cache_stats()
+        assert get_cache_stats() is None
+
+    def test_get_or_create_virtual(self, record, stats):
+        def creator():
+            return DummyVirtualSource(record, "tag/a")
+
+        for _n in range(3):
+            get_or_create_virtual(record, "tag/a", creator)
+        get_or_create_virtual(record, "tag/b", lambda: None, persist=False)
+        get_or_create_virtual(record, "tag/b", lambda: None)
+        get_or_create_virtual(record, "other@2", creator, persist=False)
+
+        tag = stats.by_prefix["tag"].as_dict()
+        assert tag["hits"] == 2
+        assert tag["missing_hits"] == 1
+        assert tag["misses"] == 2
+        assert tag["created"] == 1
+        assert tag["missing"] == 1
+        assert tag["persisted"] == 1
+        assert tag["creator_calls"] == 2
+        assert tag["lookups"] == 5
+        assert tag["hit_rate"] == pytest.approx(0.6)
+
+        other = stats.by_prefix["other"]
+        assert (other.misses, other.created, other.persisted) == (1, 1, 0)
+
+    def test_get_or_create_virtuals(self, record, stats):
+        def creator(virtual_paths):
+            return {vpath: DummyVirtualSource(record, vpath) for vpath in virtual_paths}
+
+        get_or_create_virtuals(record, ["a/1", "a/2", "b/1"], creator)
+        get_or_create_virtuals(record, ["a/1", "b/2"], creator)
+        a, b = stats.by_prefix["a"], stats.by_prefix["b"]
+        assert (a.hits, a.misses, a.created, a.creator_calls) == (1, 2, 2, 1)
+        assert (b.hits, b.misses, b.created, b.creator_calls) == (0, 2, 2, 2)
+
+    def test_creator_time(self, stats):
+        stats.record_creator_time(["a", "a", "b"], 3.0)
+        assert stats.by_prefix["a"].creator_time == pytest.approx(2.0)
+        assert stats.by_prefix["b"].creator_time == pytest.approx(1.0)
+
+    def test_no_timing(self, record):
+        stats = enable_cache_stats()
+        try:
+            get_or_create_virtual(record, "a", lambda: None)
+        finally:
+            disable_cache_stats()
+        assert stats.by_prefix["a"].creator_calls == 0
+
+    def test_reset(self, stats):
+        stats.record_lookup("a", None)
+        stats.reset()
+        assert stats.by_prefix == {}
+
+    def test_report(self):
+        stats = CacheStats()
+        stats.record_lookup("good", Ellipsis)
+        stats.record_lookup("good", object())
+        stats.record_lookup("cheap", Ellipsis)
+        stats.record_lookup("costly", Ellipsis)
+        stats.record_creator_time(["costly"], 1.5)
+        stats.by_prefix["unused"] = PrefixCacheStats()
+
+        lines = stats.report().splitlines()
+        assert lines[0].split()[0] == "prefix"
+        assert [line.split()[0] for line in lines[1:]] == [
+            "costly",
+            "cheap",
+            "unused",
+            "good",
+        ]
+        assert lines[-1].split()[1:3] == ["2", "50.0%"]
+
+
+class Test_set_persist_limit:
+    @pytest.fixture
+    def record(self, lektor_pad):
+        return lektor_pad.get("/about")
+
+    @pytest.fixture(autouse=True)
+    def persist_limit(self):
+        set_persist_limit("tag", 2)
+        try:
+            yield
+        finally:
+            set_persist_limit("tag", None)
+
+    @pytest.fixture
+    def creator(self, record):
+        def creator(virtual_path):
+            def create():
+                creator.calls.append(virtual_path)
+                return DummyVirtualSource(record, virtual_path)
+
+            return create
+
+        creator.calls = []
+        return creator
+
+    @staticmethod
+    def persisted_vpaths(pad):
+        return sorted(key[2] for key in pad.cache.persistent if key[2] is not None)
+
+    def test_evicts_least_recently_used(self, record, creator, lektor_pad):
+        for vpath in ("tag/a", "tag/b", "tag/a", "tag/c"):
+            get_or_create_virtual(record, vpath, creator(vpath))
+        assert self.persisted_vpaths(lektor_pad) == ["tag/a", "tag/c"]
+        assert creator.calls == ["tag/a", "tag/b", "tag/c"]
+
+    def test_evicted_source_is_demoted(self, record, creator, lektor_pad):
+        for vpath in ("tag/a", "tag/b", "tag/c"):
+            get_or_create_virtual(record, vpath, creator(vpath))
+        source = get_or_create_virtual(record, "tag/a", creator("tag/a"))
+        assert source in lektor_pad.cache.ephemeral.values()
+        assert creator.calls == ["tag/a", "tag/b", "tag/c"]
+
+    def test_evicted_source_is_recreated(self, record, creator, lektor_pad):
+        for vpath in ("tag/a", "tag/b", "tag/c"):
+            get_or_create_virtual(record, vpath, creator(vpath))
+        lektor_pad.cache.ephemeral.clear()
+        source = get_or_create_virtual(record, "tag/a", creator("tag/a"))
+        assert source.path == "/about@tag/a"
+        assert creator.calls == ["tag/a", "tag/b", "tag/c", "tag/a"]
+
+    def test_get_or_create_virtuals(self, record, lektor_pad):
+        def creator(virtual_paths):
+            return {vpath: DummyVirtualSource(record, vpath) for vpath in virtual_paths}
+
+        get_or_create_virtuals(record, ["tag/a", "tag/b"], creator)
+        get_or_create_virtuals(record, ["tag/a", "tag/c"], creator)
+        assert self.persisted_vpaths(lektor_pad) == ["tag/a", "tag/c"]
+
+    def test_other_prefixes_are_unbounded(self, record, creator, lektor_pad):
+        for vpath in ("other/a", "other/b", "other/c", "tag/a", "tag@2"):
+            get_or_create_virtual(record, vpath, creator(vpath))
+        assert len(self.persisted_vpaths(lektor_pad)) == 5
+
+    def test_stats(self, record, creator):
+        stats = enable_cache_stats()
+        try:
+            for vpath in ("tag/a", "tag/b", "tag/c"):
+                get_or_create_virtual(record, vpath, creator(vpath))
+        finally:
+            disable_cache_stats()
+        assert stats.by_prefix["tag"].evicted == 1
+
+    def test_negative_limit(self):
+        with pytest.raises(ValueError):
+            set_persist_limit("tag", -1)
+
+    def test_bounds_peak_memory(self, lektor_env):
+        def peak_memory(count):
+            pad = lektor.db.Database(lektor_env).new_pad()
+            record = pad.get("/about")
+
+            def creator(vpath):
+                def create():
+                    source = DummyVirtualSource(record, vpath)
+                    source.payload = bytes(4096)
+                    return source
+
+                return create
+
+            tracemalloc.start()
+            try:
+                for n in range(count):
+                    vpath = f"tag/{n}"
+                    get_or_create_virtual(record, vpath, creator(vpath))
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        set_persist_limit("tag", None)
+        unbounded = peak_memory(3000)
+        set_persist_limit("tag", 10)
+        bounded = peak_memory(3000)
+        # Evicted sources still occupy the ephemeral cache (1000 entries)
+        assert bounded < unbounded / 2
+
+
+class Test_get_or_create_virtual_threadsafe:
+    NTHREADS = 16
+
+    @pytest.fixture
+    def record(self, lektor_pad):
+        return lektor_pad.get("/about")
+
+    def run_threads(self, func):
+        barrier = threading.Barrier(self.NTHREADS)
+        results = [None] * self.NTHREADS
+
+        def run(n):
+            barrier.wait()
+            try:
+                results[n] = ("ok", func())
+            except Exception as exc:
+                results[n] = ("error", exc)
+
+        threads = [
+            threading.Thread(target=run, args=(n,)) for n in range(self.NTHREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    @pytest.mark.parametrize("missing", [False, True])
+    def test_creator_called_once(self, record, missing, lektor_pad):
+        calls = []
+
+        def creator():
+            calls.append(threading.get_ident())
+            time.sleep(0.05)
+            if not missing:
+                return DummyVirtualSource(record, "virtual/path")
+
+        results = self.run_threads(
+            lambda: get_or_create_virtual(
+                record, "virtual/path", creator, threadsafe=True
+            )
+        )
+        assert len(calls) == 1
+        assert {status for status, _ in results} == {"ok"}
+        sources = {id(source) for _, source in results}
+        assert len(sources) == 1
+        if missing:
+            assert results[0][1] is None
+        assert lektor_pad.cache.get("/about", virtual_path="virtual/path") is (
+            results[0][1]
+        )
+
+    def test_exception_is_shared(self, record):
+        calls = []
+
+        def creator():
+            calls.append(threading.get_ident())
+            time.sleep(0.05)
+            raise RuntimeError("failed")
+
+        results = self.run_threads(
+            lambda: get_or_create_virtual(
+                record, "virtual/path", creator, threadsafe=True
+            )
+        )
+        assert len(calls) == 1
+        assert {status for status, _ in results} == {"error"}
+        assert {str(exc) for _, exc in results} == {"failed"}
+
+    def test_retries_after_exception(self, record):
+        def failing_creator():
+            raise RuntimeError("failed")
+
+        with pytest.raises(RuntimeError):
+            get_or_create_virtual(
+                record, "virtual/path", failing_creator, threadsafe=True
+            )
+        source = get_or_create_virtual(
+            record,
+            "virtual/path",
+            lambda: DummyVirtualSource(record, "virtual/path"),
+            threadsafe=True,
+        )
+        assert source.path == "/about@virtual/path"
+
+    def test_cached(self, record):
+        source = DummyVirtualSource(record, "virtual/path")
+        get_or_create_virtual(record, "virtual/path", lambda: source)
+
+        def creator():
+            pytest.fail("should not be called")
+
+        assert (
+            get_or_create_virtual(record, "virtual/path", creator, threadsafe=True)
+            is source
+        )
+
+    def test_created_while_waiting_for_lock(self, record):
+        # Simulate the source being created by another thread between
+        # the initial cache lookup and the acquisition of the lock.
+        source = DummyVirtualSource(record, "virtual/path")
+        get_or_create_virtual(record, "virtual/path", lambda: source)
+
+        def creator():
+            pytest.fail("should not be called")
+
+        assert (
+            recordcache._create_single_flight(record, "virtual/path", creator, True)
+            is source
+        )
+
+    def test_persist_limit_contention(self, record, lektor_pad, monkeypatch):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        monkeypatch.setitem(recordcache._persist_limits, "tag", 2)
+        vpaths = [f"tag/{n % 5}" for n in range(500)]
+
+        def get_all():
+            for vpath in vpaths:
+                get_or_create_virtual(
+                    record,
+                    vpath,
+                    lambda vpath=vpath: DummyVirtualSource(record, vpath),
+                    threadsafe=True,
+                )
+                # evict from the ephemeral cache, too, so that sources
+                # are recreated (and re-persisted) over and over
+                lektor_pad.cache.ephemeral.clear()
+
+        try:
+            results = self.run_threads(get_all)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert results == [("ok", None)] * self.NTHREADS
+        assert len(recordcache._get_lru(lektor_pad, "tag")) == 2
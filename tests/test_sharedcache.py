@@ -0,0 +1,34 @@
+import pytest
+
+from lektorlib.sharedcache import SharedCache
+from lektorlib.testing import generate_site
+from lektorlib.testing import make_env
+
+
+class TestSharedCache:
+    @pytest.fixture
+    def source_cache(self):
+        return SharedCache()
+
+    def test_len(self, source_cache, get_cached_virtual, new_record):
+        get_cached_virtual(new_record())
+        get_cached_virtual(new_record(), virtual_path="other")
+        get_cached_virtual(new_record("/projects"))
+        assert len(source_cache) == 3
+
+    def test_invalidate(self, source_cache, get_cached_virtual, new_record, dependency):
+        get_cached_virtual(new_record())
+        get_cached_virtual(new_record("/projects"), virtual_path="other")
+        source_cache.invalidate([new_record().source_filename])
+        get_cached_virtual(new_record())
+        get_cached_virtual(new_record("/projects"), virtual_path="other")
+        assert get_cached_virtual.calls == ["vpath", "other", "vpath"]
+
+        source_cache.invalidate([dependency])
+        assert len(source_cache) == 0
+
+    def test_for_env(self, lektor_env, lektor_project, tmp_path):
+        shared_cache = SharedCache.for_env(lektor_env)
+        assert SharedCache.for_env(lektor_project.make_env()) is shared_cache
+        other_env = make_env(generate_site(tmp_path, pages=1))
+        assert SharedCache.for_env(other_env) is not shared_cache
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from lektorlib.diskcache import DiskCache
+from lektorlib.sharedcache import SharedCache
+from lektorlib.sourcecache import SourceCache
+
+
+class TestSourceCache:
+    @pytest.fixture(params=["disk", "shared"])
+    def source_cache(self, request, tmp_path):
+        if request.param == "shared":
+            yield SharedCache()
+        else:
+            disk_cache = DiskCache(tmp_path / "cache" / "cache.sqlite3")
+            yield disk_cache
+            disk_cache.close()
+
+    def test_cached_in_pad(self, get_cached_virtual, new_record):
+        record = new_record()
+        source = get_cached_virtual(record)
+        assert source.data == "data"
+        assert get_cached_virtual(record) is source
+        assert get_cached_virtual.calls == ["vpath"]
+
+    def test_cached_across_pads(self, get_cached_virtual, new_record):
+        get_cached_virtual(new_record())
+        record = new_record()
+        source = get_cached_virtual(record, data="new data")
+        assert source.data == "data"
+        assert source.record is record
+        assert source.path == "/about@vpath"
+        assert get_cached_virtual.calls == ["vpath"]
+
+    def test_keyed_by_path(self, get_cached_virtual, new_record):
+        get_cached_virtual(new_record())
+        get_cached_virtual(new_record(), virtual_path="other")
+        get_cached_virtual(new_record("/projects"))
+        assert len(get_cached_virtual.calls) == 3
+
+    def test_keyed_by_alt(self, get_cached_virtual, new_record):
+        get_cached_virtual(new_record())
+        get_cached_virtual(new_record(alt="xx"))
+        assert len(get_cached_virtual.calls) == 2
+
+    def test_remembers_missing(self, get_cached_virtual, new_record):
+        assert get_cached_virtual(new_record(), data=None) is None
+        assert get_cached_virtual(new_record(), data=None) is None
+        assert get_cached_virtual.calls == ["vpath"]
+
+    def test_invalidated_by_dependency_change(
+        self, get_cached_virtual, new_record, dependency
+    ):
+        get_cached_virtual(new_record())
+        st = dependency.stat()
+        os.utime(dependency, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert get_cached_virtual(new_record(), data="new data").data == "new data"
+        assert get_cached_virtual.calls == ["vpath", "vpath"]
+
+    def test_recomputes_on_load_failure(
+        self, source_cache, get_cached_virtual, new_record, dependency
+    ):
+        get_cached_virtual(new_record())
+
+        def load(record, state):
+            raise ValueError("stale state")
+
+        source = source_cache.get_or_create_virtual(
+            new_record(),
+            "vpath",
+            lambda: "new source",
+            dump=str,
+            load=load,
+            dependencies=[str(dependency)],
+        )
+        assert source == "new source"
+
+    def test_clear(self, source_cache, get_cached_virtual, new_record):
+        get_cached_virtual(new_record())
+        source_cache.clear()
+        get_cached_virtual(new_record())
+        assert len(get_cached_virtual.calls) == 2
+
+    @pytest.mark.parametrize("source_cache", [SourceCache()])
+    def test_storage_not_implemented(self, source_cache):
+        with pytest.raises(NotImplementedError):
+            source_cache._load_entry(("/", "_primary", "vpath"), "fingerprint")
+        with pytest.raises(NotImplementedError):
+            source_cache._store_entry(
+                ("/", "_primary", "vpath"), "fingerprint", [], None
+            )
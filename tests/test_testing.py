@@ -1,7 +1,18 @@
+import datetime
+import re
+from types import SimpleNamespace
+
+import lektor.db
 import pytest
 from lektor.context import get_ctx
 
+from lektorlib.testing import assert_dependency_budget
 from lektorlib.testing import assert_no_dependencies
+from lektorlib.testing import DependencyCounter
+from lektorlib.testing import generate_site
+from lektorlib.testing import make_env
+from lektorlib.testing import register_virtual_path_resolver
+from lektorlib.testing import SyntheticVirtualSource
 
 
 @pytest.mark.usefixtures("lektor_context")
@@ -23,3 +34,129 @@ class Test_assert_no_deps:
     def test_no_match(self):
         with assert_no_dependencies("bad"):
             get_ctx().record_dependency("good")
+
+
+@pytest.mark.usefixtures("lektor_context")
+class Test_assert_dependency_budget:
+    @staticmethod
+    def record_posts(n):
+        ctx = get_ctx()
+        for i in range(n):
+            ctx.record_dependency(f"/site/content/blog/post-{i}/contents.lr")
+        ctx.record_dependency("/site/models/blog.ini")
+
+    def test_within_budget(self):
+        with assert_dependency_budget(11) as counter:
+            self.record_posts(10)
+            self.record_posts(10)
+        assert len(counter) == 11
+
+    def test_exceeds_budget(self):
+        with pytest.raises(AssertionError) as exc_info:
+            with assert_dependency_budget(10):
+                self.record_posts(10)
+        message = str(exc_info.value)
+        assert "11 dependencies > 10" in message
+        assert "10  /site/content/blog/*/contents.lr" in message
+
+    def test_group_budget(self):
+        with assert_dependency_budget(groups={r"\.ini$": 1}):
+            self.record_posts(10)
+        with pytest.raises(AssertionError, match="matching 'post-'"):
+            with assert_dependency_budget(groups={re.compile("post-"): 9}):
+                self.record_posts(10)
+
+    def test_exception_propagates(self):
+        with pytest.raises(RuntimeError):
+            with assert_dependency_budget(0):
+                self.record_posts(1)
+                raise RuntimeError()
+
+
+class TestDependencyCounter:
+    def test_count(self, lektor_pad):
+        counter = DependencyCounter()
+        counter("a.lr")
+        counter("b.ini")
+        counter(lektor_pad.get("/projects@1"))
+        assert counter.count() == 3
+        assert counter.count(r"\.lr$") == 1
+        assert counter.count("@") == 1
+
+    def test_top_offenders(self, lektor_pad):
+        counter = DependencyCounter()
+        for i in range(3):
+            counter(f"/content/blog/post-{i}/contents.lr")
+        counter(lektor_pad.get("/projects@1"))
+        counter(lektor_pad.get("/projects@2"))
+        counter(SimpleNamespace(path="/blog@tag/python"))
+        assert counter.top_offenders() == [
+            ("/content/blog/*/contents.lr", 3),
+            ("/projects@*", 2),
+            ("/blog@tag/*", 1),
+        ]
+        assert counter.top_offenders(1) == [("/content/blog/*/contents.lr", 3)]
+
+
+class Test_generate_site:
+    @staticmethod
+    def make_pad(site_path):
+        env = make_env(site_path)
+        register_virtual_path_resolver(env)
+        return lektor.db.Database(env).new_pad()
+
+    def test_flat(self, tmp_path):
+        pad = self.make_pad(generate_site(tmp_path, pages=12))
+        blog = pad.get("/blog")
+        assert blog.children.count() == 12
+        post = pad.get("/blog/post-00003")
+        assert post["title"]
+        assert isinstance(post["pub_date"], datetime.date)
+        assert post["category"]
+        assert isinstance(post["tags"], list)
+        assert post["body"].source
+
+    def test_deterministic(self, tmp_path):
+        generate_site(tmp_path / "a", pages=3)
+        generate_site(tmp_path / "b", pages=3)
+        relpath = "content/blog/post-00002/contents.lr"
+        assert (tmp_path / "a" / relpath).read_text() == (
+            tmp_path / "b" / relpath
+        ).read_text()
+
+    def test_nested(self, tmp_path):
+        pad = self.make_pad(generate_site(tmp_path, pages=20, depth=3, fanout=2))
+        assert pad.get("/blog").children.count() == 2
+        assert pad.get("/blog/section-01").children.count() == 2
+        assert pad.get("/blog/section-01/section-00").children.count() == 5
+        assert pad.get("/blog/section-01/section-00/post-00002") is not None
+
+    def test_pagination(self, tmp_path):
+        pad = self.make_pad(generate_site(tmp_path, pages=12, per_page=5))
+        blog = pad.get("/blog")
+        assert blog.pagination.pages == 3
+        assert pad.get("/blog", page_num=3).pagination.items.count() == 2
+
+    def test_alts(self, tmp_path):
+        pad = self.make_pad(generate_site(tmp_path, pages=2, alts=["en", "de"]))
+        en = pad.get("/blog/post-00001", alt="en")
+        de = pad.get("/blog/post-00001", alt="de")
+        assert de["title"] == f"[de] {en['title']}"
+        assert de["pub_date"] == en["pub_date"]
+
+    def test_virtual_path_resolver(self, tmp_path):
+        pad = self.make_pad(generate_site(tmp_path, pages=1))
+        source = pad.get("/blog@synthetic/a/b")
+        assert isinstance(source, SyntheticVirtualSource)
+        assert source.path == "/blog@synthetic/a/b"
+        assert source.name == "a/b"
+        assert pad.get("/blog@synthetic") is None
+
+    def test_paginated_virtual_source(self, tmp_path):
+        pad = self.make_pad(generate_site(tmp_path, pages=1))
+        source = pad.get("/blog@synthetic/a/page/2")
+        assert source.name == "a"
+        assert source.page_num == 2
+        assert source.path == "/blog@synthetic/a/page/2"
+        assert source.pagination.for_page(3).path == "/blog@synthetic/a/page/3"
+        assert pad.get("/blog@synthetic/page/2") is None
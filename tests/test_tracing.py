@@ -0,0 +1,188 @@
+from functools import partial
+
+import pytest
+from lektor.db import F
+from lektor.sourceobj import VirtualSourceObject
+
+from lektorlib.query import get_source
+from lektorlib.query import PrecomputedQuery
+from lektorlib.recordcache import disable_cache_stats
+from lektorlib.recordcache import enable_cache_stats
+from lektorlib.recordcache import get_or_create_virtual
+from lektorlib.recordcache import get_or_create_virtuals
+from lektorlib.tracing import add_trace_hook
+from lektorlib.tracing import is_tracing
+from lektorlib.tracing import Profile
+from lektorlib.tracing import profile
+from lektorlib.tracing import remove_trace_hook
+from lektorlib.tracing import Span
+from lektorlib.tracing import trace
+
+
+class DummyVirtualSource(VirtualSourceObject):
+    def __init__(self, record, virtual_path):
+        VirtualSourceObject.__init__(self, record)
+        self._virtual_path = virtual_path
+
+    @property
+    def path(self):
+        return f"{self.record.path}@{self._virtual_path}"
+
+
+@pytest.fixture
+def spans():
+    spans = []
+    add_trace_hook(spans.append)
+    yield spans
+    remove_trace_hook(spans.append)
+
+
+def test_trace_hooks():
+    assert not is_tracing()
+    spans = []
+    add_trace_hook(spans.append)
+    assert is_tracing()
+    with trace("test", "/path") as span:
+        span.loaded = 2
+    remove_trace_hook(spans.append)
+    assert not is_tracing()
+    assert spans == [span]
+    assert span.duration > 0
+    assert "test '/path'" in repr(span)
+
+
+def test_trace_reports_exceptions(spans):
+    with pytest.raises(ValueError):
+        with trace("test", "/path"):
+            raise ValueError()
+    assert [span.name for span in spans] == ["test"]
+
+
+class TestProfile:
+    @pytest.fixture
+    def profile(self):
+        profile = Profile()
+        for name, path, duration in [
+            ("a", "/x", 1.0),
+            ("a", "/x", 2.0),
+            ("b", "/x", 0.5),
+            ("a", "/y", 4.0),
+        ]:
+            span = Span(name, path)
+            span.duration = duration
+            span.loaded = 3
+            span.yielded = 1
+            profile(span)
+        return profile
+
+    def test_aggregates(self, profile):
+        entry = profile.entries["a", "/x"]
+        assert entry.calls == 2
+        assert entry.duration == 3.0
+        assert entry.loaded == 6
+        assert entry.yielded == 2
+
+    def test_as_dict(self, profile):
+        data = profile.as_dict()
+        assert set(data) == {"a", "b"}
+        assert data["a"]["/y"] == {
+            "calls": 1,
+            "duration": 4.0,
+            "loaded": 3,
+            "yielded": 1,
+            "filter_time": 0.0,
+        }
+
+    def test_report(self, profile):
+        lines = profile.report().splitlines()
+        assert "operation" in lines[0]
+        assert [line.split()[:2] for line in lines[1:]] == [
+            ["a", "/y"],
+            ["a", "/x"],
+            ["b", "/x"],
+        ]
+        assert len(profile.report(top=1).splitlines()) == 2
+
+    def test_reset(self, profile):
+        profile.reset()
+        assert profile.entries == {}
+
+
+def test_profile():
+    with profile() as prof:
+        assert is_tracing()
+        with trace("test", "/path"):
+            pass
+    assert not is_tracing()
+    assert prof.entries["test", "/path"].calls == 1
+
+
+class TestQueryTracing:
+    @pytest.fixture
+    def query(self, lektor_pad):
+        return PrecomputedQuery("/blog", lektor_pad, [f"post-{c}" for c in "abcdef"])
+
+    def test_iterate(self, query, spans):
+        news = [post["_id"] for post in query.filter(F.category == "news")]
+        (span,) = [span for span in spans if span.name == "iterate"]
+        assert span.path == "/blog"
+        assert span.loaded == 6
+        assert span.yielded == len(news) < 6
+        assert 0 < span.filter_time < span.duration
+
+    def test_iterate_not_exhausted(self, query, spans):
+        assert query.filter(F.category == "misc").first()["_id"] == "post-c"
+        (span,) = [span for span in spans if span.name == "iterate"]
+        assert span.loaded == 3
+        assert span.yielded == 1
+
+    def test_iterate_matches_untraced(self, query, spans):
+        traced = list(query.filter(F.category == "news"))
+        remove_trace_hook(spans.append)
+        try:
+            assert list(query.filter(F.category == "news")) == traced
+        finally:
+            add_trace_hook(spans.append)
+
+    @pytest.mark.parametrize(
+        "path, parent, loaded",
+        [
+            ("/blog/post-a", "/blog", 1),
+            ("/blog/missing", "/blog", 0),
+            ("/about", "/", 1),
+        ],
+    )
+    def test_get_source(self, lektor_pad, spans, path, parent, loaded):
+        get_source(lektor_pad, path)
+        (span,) = spans
+        assert (span.name, span.path, span.loaded) == ("get_source", parent, loaded)
+
+
+class TestCreatorTracing:
+    @pytest.fixture
+    def record(self, lektor_pad):
+        return lektor_pad.get("/about")
+
+    def test_get_or_create_virtual(self, record, spans):
+        creator = partial(DummyVirtualSource, record, "vpath")
+        get_or_create_virtual(record, "vpath", creator)
+        get_or_create_virtual(record, "vpath", creator)
+        (span,) = spans
+        assert (span.name, span.path, span.loaded) == ("create_virtual", "/about", 1)
+
+    def test_get_or_create_virtuals(self, record, spans):
+        def creator(virtual_paths):
+            return {vp: DummyVirtualSource(record, vp) for vp in virtual_paths}
+
+        get_or_create_virtuals(record, ["a", "b"], creator)
+        (span,) = spans
+        assert span.loaded == 2
+
+    def test_with_cache_stats(self, record, spans):
+        stats = enable_cache_stats(timing=True)
+        try:
+            get_or_create_virtual(record, "vpath", lambda: None)
+        finally:
+            disable_cache_stats()
+        assert len(spans) == 1
+        assert stats.by_prefix["vpath"].creator_calls == 1